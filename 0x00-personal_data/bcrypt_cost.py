@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+""" bcrypt cost factor calibration
+
+Picks the highest bcrypt cost whose hash time stays under a latency budget
+on the current hardware, persists it, and tells callers when a stored hash
+was made with a lower cost and should be rehashed.
+
+Calibration takes seconds on slow hardware, so it never runs on the
+request path: call ensure_calibrated() at startup, or run this module as
+a CLI. Until then get_cost() returns bcrypt's default cost.
+
+Calibration never picks a cost below BCRYPT_MIN_COST, which may be lower
+than the default so that slow hardware stays within its budget. Stored
+hashes are only ever rehashed upward, so lowering the cost leaves them as
+they are.
+"""
+import argparse
+import bcrypt
+import json
+import os
+import threading
+import time
+from typing import Dict, Union
+
+
+TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "250"))
+COST_FILE = os.getenv("BCRYPT_COST_FILE", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".bcrypt_cost.json"))
+DEFAULT_COST = 12
+MIN_COST = int(os.getenv("BCRYPT_MIN_COST", "10"))
+MAX_COST = 16
+
+_lock = threading.Lock()
+_state = {
+    "cost": None, "target_ms": None, "measured_ms": None,
+    "calibrated_at": None, "rehashes": 0,
+}
+
+
+def measure(cost: int, samples: int = 3) -> float:
+    """ Returns the median time, in milliseconds, of hashing a password
+    with the given cost
+
+    Args:
+        cost: bcrypt log rounds
+        samples: number of hashes timed
+    """
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", bcrypt.gensalt(cost))
+        timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)[len(timings) // 2]
+
+
+def calibrate(target_ms: float = TARGET_MS, min_cost: int = MIN_COST,
+              max_cost: int = MAX_COST) -> Dict:
+    """ Finds the highest cost whose hash time fits in target_ms
+
+    The cost never goes below min_cost, even on hardware too slow to meet
+    the budget with it.
+
+    Args:
+        target_ms: latency budget of one hash, in milliseconds
+        min_cost: lowest acceptable cost
+        max_cost: highest cost tried
+    Returns:
+        The calibration: cost, target_ms, measured_ms and calibrated_at
+    """
+    cost = min_cost
+    measured = measure(cost)
+    while cost < max_cost:
+        # every extra round doubles the work, skip costs that cannot fit
+        if measured * 2 > target_ms:
+            break
+        candidate = measure(cost + 1)
+        if candidate > target_ms:
+            break
+        cost, measured = cost + 1, candidate
+    return {
+        "cost": cost, "target_ms": target_ms,
+        "measured_ms": round(measured, 2), "calibrated_at": time.time(),
+    }
+
+
+def save(calibration: Dict, path: str = COST_FILE) -> None:
+    """ Persists a calibration to path and makes it the current one
+
+    Args:
+        calibration: a dictionary returned by calibrate()
+        path: JSON file holding the calibration
+    """
+    with open(path, "w") as f:
+        json.dump(calibration, f)
+    with _lock:
+        _state.update(calibration)
+
+
+def load(path: str = COST_FILE) -> bool:
+    """ Makes the calibration persisted in path the current one
+
+    Args:
+        path: JSON file holding the calibration
+    Returns:
+        False if path holds no valid calibration
+    """
+    try:
+        with open(path) as f:
+            calibration = json.load(f)
+        calibration["cost"] = int(calibration["cost"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return False
+    with _lock:
+        _state.update(calibration)
+    return True
+
+
+def ensure_calibrated(path: str = COST_FILE) -> int:
+    """ Loads the calibration persisted in path, or calibrates the
+    hardware and persists the result; meant to run once at startup
+
+    Args:
+        path: JSON file holding the calibration
+    Returns:
+        The current cost
+    """
+    if not load(path):
+        calibration = calibrate()
+        try:
+            save(calibration, path)
+        except OSError:
+            with _lock:
+                _state.update(calibration)
+    return get_cost(path)
+
+
+def get_cost(path: str = COST_FILE) -> int:
+    """ Returns the cost to hash new passwords with
+
+    On first use the persisted calibration is loaded from path. Without
+    one, DEFAULT_COST is used: this never calibrates, see
+    ensure_calibrated().
+
+    Args:
+        path: JSON file holding the calibration
+    """
+    with _lock:
+        cost = _state["cost"]
+    if cost is None and not load(path):
+        with _lock:
+            if _state["cost"] is None:
+                _state["cost"] = DEFAULT_COST
+    with _lock:
+        return _state["cost"]
+
+
+def hash_cost(hashed_password: Union[bytes, str]) -> int:
+    """ Returns the cost a bcrypt hash was made with
+
+    Args:
+        hashed_password: a bcrypt hash, e.g. $2b$12$...
+    """
+    if isinstance(hashed_password, bytes):
+        hashed_password = hashed_password.decode("ascii")
+    return int(hashed_password.split("$")[2])
+
+
+def needs_rehash(hashed_password: Union[bytes, str]) -> bool:
+    """ Tells whether a stored hash was made with a lower cost than the
+    current one and should be recomputed, typically right after a
+    successful login; hashes are never rehashed to a lower cost
+
+    Args:
+        hashed_password: a bcrypt hash
+    """
+    try:
+        return hash_cost(hashed_password) < get_cost()
+    except (IndexError, ValueError, UnicodeDecodeError):
+        return False
+
+
+def record_rehash() -> None:
+    """ Counts a stored hash upgraded to the current cost
+    """
+    with _lock:
+        _state["rehashes"] += 1
+
+
+def metrics() -> Dict:
+    """ Returns the current calibration and the number of rehashes
+    """
+    with _lock:
+        return dict(_state)
+
+
+def main() -> None:
+    """ Main function
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--target-ms", type=float, default=TARGET_MS,
+                        help="latency budget of one hash")
+    parser.add_argument("--min-cost", type=int, default=MIN_COST)
+    parser.add_argument("--max-cost", type=int, default=MAX_COST)
+    parser.add_argument("--file", default=COST_FILE,
+                        help="where the calibration is persisted")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="print the calibration without persisting it")
+    args = parser.parse_args()
+
+    calibration = calibrate(args.target_ms, args.min_cost, args.max_cost)
+    if not args.dry_run:
+        save(calibration, args.file)
+    print(json.dumps(calibration))
+
+
+if __name__ == "__main__":
+    main()
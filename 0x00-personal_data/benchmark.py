@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+""" PII layer throughput benchmark
+
+The redaction suite measures the cost per log line of filter_datum(),
+RedactingFormatter.format and get_logger().info on synthetic data, varying
+one parameter at a time (message length, field count, share of lines with
+PII, separator) around a baseline. The hashing suite measures bcrypt
+hashes/sec of hash_passwords() against the number of worker threads.
+Results are printed as JSON so runs can be compared.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import re
+import string
+import subprocess
+import time
+from typing import Callable, Dict, List, Sequence
+from encrypt_password import hash_passwords
+from filtered_logger import PII_FIELDS, RedactingFormatter, filter_datum, \
+    get_logger
+
+
+BASELINE = {"length": 256, "fields": 5, "pii_share": 1.0, "separator": ";"}
+VARIATIONS = {
+    "length": [64, 256, 1024, 4096],
+    "fields": [5, 50, 500],
+    "pii_share": [0.0, 0.1, 0.5, 1.0],
+    "separator": [";", "|"],
+}
+
+
+def legacy_filter_datum(
+        fields: List[str], redaction: str, message: str, separator: str
+) -> str:
+    """ Per-field implementation of filter_datum, kept as the baseline
+    """
+    for field in fields:
+        regex = fr'(?<={field}=)[^{separator}]*'
+        message = re.sub(regex, redaction, message)
+    return message
+
+
+def field_catalog(count: int, seed: int = 0) -> List[str]:
+    """ Returns PII_FIELDS padded with random field names up to count
+
+    Args:
+        count: number of fields wanted
+        seed: random seed, for reproducible catalogs
+    """
+    rng = random.Random(seed)
+    fields = list(PII_FIELDS[:count])
+    while len(fields) < count:
+        fields.append("".join(rng.choices(string.ascii_lowercase + "_",
+                                          k=rng.randint(4, 16))))
+    return fields
+
+
+def synthetic_lines(
+        count: int, fields: Sequence[str], length: int, pii_share: float,
+        separator: str, seed: int = 0
+) -> List[str]:
+    """ Generates key=value log lines of about length characters
+
+    Args:
+        count: number of lines
+        fields: PII fields; a line with PII carries up to five of them
+        length: approximate number of characters per line
+        pii_share: fraction of lines carrying PII fields
+        separator: character that separates all fields in a line
+        seed: random seed, for reproducible data
+    """
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + "@.-:/ "
+    lines = []
+    for _ in range(count):
+        pairs = []
+        if rng.random() < pii_share:
+            sample = rng.sample(list(fields), min(5, len(fields)))
+            pairs = [f"{field}={''.join(rng.choices(alphabet, k=12))}"
+                     for field in sample]
+        while sum(len(pair) + 1 for pair in pairs) < length:
+            key = rng.choice(("ip", "last_login", "user_agent", "path"))
+            pairs.append(f"{key}={''.join(rng.choices(alphabet, k=24))}")
+        rng.shuffle(pairs)
+        lines.append(separator.join(pairs) + separator)
+    return lines
+
+
+def per_sec(func: Callable[[object], object], lines: Sequence) -> float:
+    """ Returns how many lines per second func processes
+
+    Args:
+        func: called once per line
+        lines: the log lines, as strings or field mappings
+    """
+    start = time.perf_counter()
+    for line in lines:
+        func(line)
+    return len(lines) / (time.perf_counter() - start)
+
+
+def run_case(lines_count: int, length: int, fields: int, pii_share: float,
+             separator: str) -> List[Dict]:
+    """ Benchmarks every target for one parameter combination
+
+    Returns:
+        One result dictionary per target
+    """
+    catalog = field_catalog(fields)
+    lines = synthetic_lines(lines_count, catalog, length, pii_share,
+                            separator)
+    rows = [dict(pair.split("=", 1) for pair in line.split(separator)
+                 if pair) for line in lines]
+    formatter = type("Formatter", (RedactingFormatter,),
+                     {"SEPARATOR": separator})(catalog)
+
+    def record(line):
+        return logging.LogRecord("user_data", logging.INFO, None, None,
+                                 line, None, None)
+
+    logger = get_logger()
+    handler = logger.handlers[0]
+    handler.setFormatter(formatter)
+    with open(os.devnull, "w") as devnull:
+        handler.setStream(devnull)
+        targets = {
+            "legacy_filter_datum": (lambda line: legacy_filter_datum(
+                catalog, "***", line, separator), lines),
+            "filter_datum": (lambda line: filter_datum(
+                catalog, "***", line, separator), lines),
+            "RedactingFormatter.format": (lambda line: formatter.format(
+                record(line)), lines),
+            "RedactingFormatter.format(dict)": (lambda row: formatter.format(
+                record(row)), rows),
+            "get_logger().info": (logger.info, lines),
+        }
+        if fields > 50:
+            del targets["legacy_filter_datum"]
+        results = [
+            {"target": target, "length": length, "fields": fields,
+             "pii_share": pii_share, "separator": separator,
+             "lines_per_sec": round(per_sec(func, items))}
+            for target, (func, items) in targets.items()
+        ]
+    logger.removeHandler(handler)
+    return results
+
+
+def run_hashing(hashes: int, workers: int) -> Dict:
+    """ Benchmarks hash_passwords() with a given number of threads
+
+    Returns:
+        A result dictionary
+    """
+    passwords = [f"password{i}" for i in range(hashes)]
+    start = time.perf_counter()
+    for _ in hash_passwords(passwords, workers):
+        pass
+    elapsed = time.perf_counter() - start
+    return {"target": "hash_passwords", "workers": workers,
+            "hashes_per_sec": round(hashes / elapsed, 2)}
+
+
+def main() -> None:
+    """ Main function
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, default=20000,
+                        help="lines per measurement")
+    parser.add_argument("--hashes", type=int, default=32,
+                        help="passwords hashed per measurement")
+    parser.add_argument("--suite", choices=("redaction", "hashing"),
+                        default="redaction", help="what to measure")
+    parser.add_argument("--output", help="JSON file, default stdout")
+    args = parser.parse_args()
+
+    if args.suite == "hashing":
+        results = [
+            run_hashing(args.hashes, workers)
+            for workers in sorted({1, 2, 4, 8, os.cpu_count() or 1})
+        ]
+    else:
+        cases = [dict(BASELINE)]
+        for parameter, values in VARIATIONS.items():
+            cases.extend(dict(BASELINE, **{parameter: value})
+                         for value in values
+                         if value != BASELINE[parameter])
+        results = [
+            result for case in cases
+            for result in run_case(args.lines, **case)
+        ]
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    report = {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "suite": args.suite,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
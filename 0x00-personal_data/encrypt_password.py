@@ -1,10 +1,19 @@
 #!/usr/bin/env python3
 """ Encrypting Passwords """
 import bcrypt
+from bcrypt_cost import get_cost
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import os
+from typing import Callable, Iterable, Iterator, Tuple
+
+
+HASH_WORKERS = os.cpu_count() or 1
 
 
 def hash_password(password: str) -> bytes:
-    """ A function that hashes and encrypts a password
+    """ A function that hashes and encrypts a password with the
+    calibrated bcrypt cost (see bcrypt_cost)
 
     Args:
         password: a string representing user password
@@ -12,7 +21,7 @@ def hash_password(password: str) -> bytes:
         A byte string
     """
     pwd = password.encode("utf-8")
-    return bcrypt.hashpw(pwd, bcrypt.gensalt())
+    return bcrypt.hashpw(pwd, bcrypt.gensalt(get_cost()))
 
 
 def is_valid(hashed_password: bytes, password: str) -> bool:
@@ -27,3 +36,54 @@ def is_valid(hashed_password: bytes, password: str) -> bool:
     """
     pwd = password.encode("utf-8")
     return bcrypt.checkpw(pwd, hashed_password)
+
+
+def _map_ordered(
+        func: Callable, items: Iterable, workers: int = None
+) -> Iterator:
+    """ Maps func over items on a thread pool, yielding results in input
+    order as soon as they are ready
+
+    At most twice as many items as workers are in flight, so items are
+    consumed lazily and arbitrarily long iterables can be streamed.
+    """
+    workers = workers or HASH_WORKERS
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(func, *item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def hash_passwords(
+        passwords: Iterable[str], workers: int = None
+) -> Iterator[bytes]:
+    """ Hashes many passwords concurrently; bcrypt releases the GIL while
+    hashing so the work spreads across cores
+
+    Args:
+        passwords: password strings, possibly a lazy iterable
+        workers: number of hashing threads, defaults to the CPU count
+    Returns:
+        An iterator of hashed passwords, in input order
+    """
+    return _map_ordered(
+        hash_password, ((password,) for password in passwords), workers
+    )
+
+
+def verify_many(
+        pairs: Iterable[Tuple[bytes, str]], workers: int = None
+) -> Iterator[bool]:
+    """ Validates many (hashed_password, password) pairs concurrently
+
+    Args:
+        pairs: (hashed_password, password) tuples, possibly lazy
+        workers: number of hashing threads, defaults to the CPU count
+    Returns:
+        An iterator of booleans, in input order
+    """
+    return _map_ordered(is_valid, pairs, workers)
@@ -1,13 +1,136 @@
 #!/usr/bin/env python3
 """ PII Obfuscation """
+import argparse
+import atexit
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import copy
+import functools
 import logging
-from typing import List, Union
+import logging.handlers
+from typing import (
+    Callable, Dict, Iterable, Iterator, List, Mapping, Sequence, TextIO,
+    Tuple, Union
+)
 import re
 import mysql.connector
 import os
+import queue
+import shutil
+import sys
+import tempfile
+import threading
+import time
 
 
 PII_FIELDS = ("name", "email", "phone", "ssn", "password")
+USER_COLUMNS = PII_FIELDS + ("ip", "last_login", "user_agent")
+REDACTOR_CACHE_SIZE = 128
+AUTOMATON_MIN_FIELDS = 100
+EXPORT_BATCH_SIZE = int(os.getenv("PERSONAL_DATA_BATCH_SIZE", "1000"))
+EXPORT_PROGRESS_INTERVAL = 5.0
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 256
+DB_POOL_SIZE = int(os.getenv("PERSONAL_DATA_DB_POOL_SIZE", "5"))
+
+
+class FieldAutomaton:
+    """ Aho-Corasick automaton matching every "<field>=" pattern at once
+
+    The automaton is built once from the field list and compiled into a
+    deterministic transition table, so a log line is redacted in a single
+    left-to-right scan whose cost does not depend on how many fields are
+    in the catalog. Semantics match the regex redactor: a field matches
+    wherever "<field>=" appears and its value runs up to the separator.
+    """
+
+    def __init__(
+            self, fields: Sequence[str], redaction: str, separator: str
+    ):
+        self.redaction = redaction
+        self._value = re.compile(fr'[^{re.escape(separator)}]*')
+        goto = [{}]
+        accept = [False]
+        for field in fields:
+            state = 0
+            for char in f"{field}=":
+                if char not in goto[state]:
+                    goto.append({})
+                    accept.append(False)
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            accept[state] = True
+
+        # breadth-first: a state's table is its failure state's table
+        # overlaid with its own edges, giving a full transition function
+        delta = [None] * len(goto)
+        delta[0] = dict(goto[0])
+        pending = [(child, 0) for child in goto[0].values()]
+        for state, fail in pending:
+            delta[state] = dict(delta[fail], **goto[state])
+            accept[state] = accept[state] or accept[fail]
+            pending.extend(
+                (child, delta[fail].get(char, 0))
+                for char, child in goto[state].items()
+            )
+        self._delta = delta
+        self._accept = accept
+
+    def __call__(self, message: str) -> str:
+        """ Redacts every field value of message in one scan
+
+        Args:
+            message: the log line
+        """
+        delta = self._delta
+        accept = self._accept
+        value = self._value.match
+        pieces = []
+        start = state = i = 0
+        size = len(message)
+        while i < size:
+            state = delta[state].get(message[i], 0)
+            i += 1
+            if accept[state]:
+                pieces.append(message[start:i])
+                pieces.append(self.redaction)
+                start = i = value(message, i).end()
+                state = 0
+        if not pieces:
+            return message
+        pieces.append(message[start:])
+        return "".join(pieces)
+
+
+@functools.lru_cache(maxsize=REDACTOR_CACHE_SIZE)
+def get_redactor(
+        fields: Sequence[str], redaction: str, separator: str
+) -> Callable[[str], str]:
+    """ Compiles a single-pass redactor for a set of fields
+
+    All fields are folded into one alternation so a log line is scanned
+    once no matter how many fields are obfuscated. Catalogs of at least
+    AUTOMATON_MIN_FIELDS fields use a FieldAutomaton instead, whose cost
+    does not grow with the number of fields. Redactors are cached per
+    (fields, redaction, separator) with LRU eviction.
+
+    Args:
+        fields: hashable sequence (tuple) of fields to obfuscate
+        redaction: string representing obfuscated fields
+        separator: character that separates all fields in the log line
+    Returns:
+        A callable taking a log line and returning it redacted
+    """
+    if not fields:
+        return str
+    if len(fields) >= AUTOMATON_MIN_FIELDS:
+        return FieldAutomaton(fields, redaction, separator)
+    alternation = "|".join(re.escape(field) for field in fields)
+    pattern = re.compile(
+        fr'({alternation})=[^{re.escape(separator)}]*'
+    )
+    replacement = r'\1=' + redaction.replace('\\', r'\\')
+    return functools.partial(pattern.sub, replacement)
 
 
 def filter_datum(
@@ -21,14 +144,16 @@ def filter_datum(
         message: the log line
         separator: character that separates all fields in the log line
     """
-    for field in fields:
-        regex = fr'(?<={field}=)[^{separator}]*'
-        message = re.sub(regex, redaction, message)
-    return message
+    return get_redactor(tuple(fields), redaction, separator)(message)
 
 
 class RedactingFormatter(logging.Formatter):
     """ Redacting Formatter class
+
+    Records whose msg is a mapping (e.g. logger.info(row_dict)) are
+    structured: PII fields are replaced by key lookup while the message is
+    serialized, without any regex scan. Free-form string messages fall
+    back to filter_datum().
     """
 
     REDACTION = "***"
@@ -38,6 +163,10 @@ class RedactingFormatter(logging.Formatter):
     def __init__(self, fields: List[str]):
         super(RedactingFormatter, self).__init__(self.FORMAT)
         self.fields = fields
+        self._pii = frozenset(fields)
+        self._redact = get_redactor(
+            tuple(fields), self.REDACTION, self.SEPARATOR
+        )
 
     def format(self, record: logging.LogRecord) -> str:
         """ Filters values in incoming log records using filter_datum()
@@ -45,60 +174,612 @@ class RedactingFormatter(logging.Formatter):
         Args:
             record: information or event being logged.
         """
-        return filter_datum(
-            self.fields, self.REDACTION, super().format(record),
-            self.SEPARATOR
+        if not isinstance(record.msg, Mapping):
+            return self._redact(super().format(record))
+
+        message = self.format_fields(record.msg)
+        if record.exc_info or record.exc_text or record.stack_info:
+            record = logging.makeLogRecord(
+                dict(record.__dict__, msg=message, args=None)
+            )
+            return self._redact(super().format(record))
+        record.message = message
+        if self.usesTime():
+            record.asctime = self.formatTime(record, self.datefmt)
+        return self.formatMessage(record)
+
+    def format_fields(self, fields: Mapping) -> str:
+        """ Serializes a mapping into a key=value; message, redacting PII
+        fields by key
+
+        Args:
+            fields: field names mapped to their values
+        """
+        pii = self._pii
+        redaction = self.REDACTION
+        return f"{self.SEPARATOR} ".join(
+            f"{key}={redaction if key in pii else value}"
+            for key, value in fields.items()
+        ) + self.SEPARATOR
+
+    def format_batch(
+            self, messages: Iterable[Union[str, Mapping]],
+            name: str = "user_data", level: int = logging.INFO
+    ) -> str:
+        """ Formats and redacts a batch of messages into one block of
+        log lines sharing a single record header
+
+        Args:
+            messages: log messages to format, strings or field mappings
+            name: logger name shown in the header
+            level: logging level shown in the header
+        Returns:
+            Newline terminated log lines ready for a single write
+        """
+        record = logging.LogRecord(name, level, None, None, "", None, None)
+        header = super().format(record)
+        redact = self._redact
+        format_fields = self.format_fields
+        return "".join(
+            f"{header}{format_fields(msg)}\n" if isinstance(msg, Mapping)
+            else f"{header}{redact(msg)}\n"
+            for msg in messages
         )
 
 
-def get_logger() -> logging.Logger:
+class AsyncRedactingHandler(logging.handlers.QueueHandler):
+    """ Queue handler that only enqueues records on the caller's thread
+
+    A background listener thread drains the bounded queue, redacts the
+    records with RedactingFormatter and writes them to the stream in
+    batches. When the queue is full, records are dropped (and counted in
+    dropped) unless block is set, in which case the caller waits.
+    """
+
+    def __init__(
+            self, stream: TextIO = None, fields: Sequence[str] = PII_FIELDS,
+            maxsize: int = LOG_QUEUE_SIZE, block: bool = False,
+            batch_size: int = LOG_BATCH_SIZE
+    ):
+        super().__init__(queue.Queue(maxsize))
+        self.stream = stream if stream is not None else sys.stderr
+        self.redacting_formatter = RedactingFormatter(fields)
+        self.block = block
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._listener = threading.Thread(
+            target=self._listen, name="user_data-log-listener", daemon=True
+        )
+        self._listener.start()
+        atexit.register(self.close)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """ Returns a shallow copy of the record, with copies of a mapping
+        msg or args, so a row changed after being logged is still written
+        as it was; %-formatting, traceback rendering and redaction all
+        happen on the listener thread, and structured records keep their
+        mapping
+
+        Args:
+            record: information or event being logged.
+        """
+        record = copy.copy(record)
+        if isinstance(record.msg, Mapping):
+            record.msg = dict(record.msg)
+        if isinstance(record.args, Mapping):
+            record.args = dict(record.args)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """ Puts a record on the queue according to the block policy
+
+        Args:
+            record: information or event being logged.
+        """
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _listen(self) -> None:
+        """ Listener loop: formats and writes records a batch at a time
+        until the None sentinel is dequeued
+        """
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [record for record in batch if record is not None]
+            try:
+                if records:
+                    fmt = self.redacting_formatter.format
+                    self.stream.write(
+                        "".join(f"{fmt(record)}\n" for record in records)
+                    )
+                    self.stream.flush()
+            except Exception:
+                for record in records:
+                    self.handleError(record)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if len(records) < len(batch):
+                return
+
+    def flush(self) -> None:
+        """ Blocks until every enqueued record has been written
+        """
+        if self._listener.is_alive():
+            self.queue.join()
+
+    def close(self) -> None:
+        """ Flushes pending records and stops the listener thread
+        """
+        if self._listener.is_alive():
+            self.queue.put(None)
+            self._listener.join()
+        atexit.unregister(self.close)
+        super().close()
+
+
+def get_logger(
+        asynchronous: bool = False, block: bool = False
+) -> logging.Logger:
     """ A function that returns a logger object
+
+    The logger is configured once; later calls reuse its handler unless a
+    different mode is requested.
+
+    Args:
+        asynchronous: enqueue records and redact/write them on a
+            background thread instead of the caller's thread
+        block: in asynchronous mode, wait for room in a full queue instead
+            of dropping the record
     """
     logger = logging.getLogger("user_data")
     logger.setLevel(logging.INFO)
     logger.propagate = False
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(RedactingFormatter(PII_FIELDS))
-    logger.addHandler(stream_handler)
+    handler_type = (
+        AsyncRedactingHandler if asynchronous else logging.StreamHandler
+    )
+    if logger.handlers and all(
+        type(handler) is handler_type
+        and getattr(handler, "block", block) == block
+        for handler in logger.handlers
+    ):
+        return logger
+
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    if asynchronous:
+        logger.addHandler(AsyncRedactingHandler(block=block))
+    else:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(RedactingFormatter(PII_FIELDS))
+        logger.addHandler(stream_handler)
     return logger
 
 
+def get_progress_logger() -> logging.Logger:
+    """ Returns the logger of export progress
+
+    It sits outside the user_data tree and writes to stdout, so progress
+    lines never end up among the redacted records, which go to stderr.
+    """
+    logger = logging.getLogger("export_progress")
+    if not logger.handlers:
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s %(name)s: %(message)s")
+        )
+        logger.addHandler(handler)
+    return logger
+
+
+def connect_db() -> mysql.connector.connection.MySQLConnection:
+    """ Opens a new connection to the database from the
+    PERSONAL_DATA_DB_* environment variables
+
+    Returns:
+        MySQLConnection object
+    Raises:
+        mysql.connector.Error if the connection cannot be established
+    """
+    return mysql.connector.connect(
+        user=os.getenv("PERSONAL_DATA_DB_USERNAME", "root"),
+        password=os.getenv("PERSONAL_DATA_DB_PASSWORD", ""),
+        host=os.getenv("PERSONAL_DATA_DB_HOST", "localhost"),
+        database=os.getenv("PERSONAL_DATA_DB_NAME")
+    )
+
+
 def get_db() -> mysql.connector.connection.MySQLConnection:
     """ Establishes a connection to a database
 
     Returns:
         MySQLConnection object is successful
     """
-    username = os.getenv("PERSONAL_DATA_DB_USERNAME", "root")
-    password = os.getenv("PERSONAL_DATA_DB_PASSWORD", "")
-    host = os.getenv("PERSONAL_DATA_DB_HOST", "localhost")
-    database = os.getenv("PERSONAL_DATA_DB_NAME")
-
     try:
-        connection = mysql.connector.connect(
-            user=username,
-            password=password,
-            host=host,
-            database=database
-        )
-        return connection
+        return connect_db()
     except mysql.connector.Error as e:
         return None
 
 
+class ConnectionPool:
+    """ Bounded pool of reusable database connections
+
+    Connections are opened lazily up to size, health checked on checkout
+    (broken ones are closed and replaced) and returned to the pool when
+    released. Once size connections are checked out, callers wait.
+    """
+
+    def __init__(
+            self, connect: Callable = connect_db, size: int = DB_POOL_SIZE,
+            timeout: float = None
+    ):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._metrics = {
+            "checkouts": 0, "waits": 0, "connects": 0, "discarded": 0
+        }
+
+    @staticmethod
+    def is_healthy(connection) -> bool:
+        """ Checks that a pooled connection is still usable
+
+        Args:
+            connection: a DB-API connection
+        """
+        try:
+            if hasattr(connection, "is_connected"):
+                return connection.is_connected()
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _open(self):
+        """ Opens a new connection, counted against the pool size
+        """
+        try:
+            connection = self.connect()
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+        with self._lock:
+            self._metrics["connects"] += 1
+        return connection
+
+    def _discard(self, connection) -> None:
+        """ Closes a connection and frees its slot in the pool
+        """
+        with self._lock:
+            self._opened -= 1
+            self._metrics["discarded"] += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """ Checks a healthy connection out of the pool
+
+        Raises:
+            queue.Empty if timeout expires while the pool is exhausted
+        """
+        with self._lock:
+            self._metrics["checkouts"] += 1
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_open = self._opened < self.size
+                    if can_open:
+                        self._opened += 1
+                    else:
+                        self._metrics["waits"] += 1
+                if can_open:
+                    return self._open()
+                connection = self._idle.get(timeout=self.timeout)
+            if self.is_healthy(connection):
+                return connection
+            self._discard(connection)
+
+    def release(self, connection) -> None:
+        """ Returns a checked out connection to the pool
+
+        Args:
+            connection: a connection obtained from acquire()
+        """
+        self._idle.put(connection)
+
+    @contextlib.contextmanager
+    def connection(self) -> Iterator:
+        """ Context manager checking a connection out for a with block
+        """
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def metrics(self) -> Dict[str, int]:
+        """ Returns pool counters: checkouts, waits, connects, discarded,
+        plus the current number of open and idle connections
+        """
+        with self._lock:
+            metrics = dict(self._metrics, open=self._opened)
+        metrics["idle"] = self._idle.qsize()
+        return metrics
+
+    def close(self) -> None:
+        """ Closes every idle connection in the pool
+        """
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                self._opened -= 1
+            connection.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """ Returns the process-wide connection pool, created on first use
+    with PERSONAL_DATA_DB_POOL_SIZE connections
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool()
+        return _pool
+
+
+def unbuffered_cursor(db):
+    """ Returns a cursor that streams rows from the server instead of
+    buffering the whole result set on the client
+
+    Args:
+        db: a DB-API connection
+    """
+    try:
+        return db.cursor(buffered=False)
+    except TypeError:
+        return db.cursor()
+
+
+def export_users(
+        db, stream: TextIO, batch_size: int = EXPORT_BATCH_SIZE,
+        query: str = "SELECT * FROM users"
+) -> int:
+    """ Streams the users table to stream as redacted log lines
+
+    Rows are pulled with fetchmany() so only one batch is held in memory,
+    and each batch is formatted, redacted and written with a single write.
+    Progress is reported by get_progress_logger(), never to stream.
+
+    Args:
+        db: a DB-API connection
+        stream: text stream receiving the log lines
+        batch_size: number of rows fetched, formatted and written at once
+        query: the SELECT statement to export
+    Returns:
+        Number of rows exported
+    """
+    progress = get_progress_logger()
+    formatter = RedactingFormatter(PII_FIELDS)
+    cursor = unbuffered_cursor(db)
+    rows = 0
+    start = reported = time.perf_counter()
+    try:
+        cursor.execute(query)
+        columns = [description[0] for description in cursor.description]
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            stream.write(formatter.format_batch(
+                dict(zip(columns, row)) for row in batch
+            ))
+            rows += len(batch)
+            now = time.perf_counter()
+            if now - reported >= EXPORT_PROGRESS_INTERVAL:
+                reported = now
+                progress.info("exported %d rows (%.0f rows/sec)",
+                              rows, rows / (now - start))
+    finally:
+        cursor.close()
+    stream.flush()
+    elapsed = time.perf_counter() - start
+    progress.info("exported %d rows (%.0f rows/sec)",
+                  rows, rows / elapsed if elapsed else 0.0)
+    return rows
+
+
+def shard_ranges(total: int, workers: int) -> List[Tuple[int, int]]:
+    """ Splits total rows into at most workers (offset, limit) ranges
+
+    Args:
+        total: number of rows to split
+        workers: number of shards wanted
+    """
+    size = max(1, -(-total // max(1, workers)))
+    return [
+        (offset, min(size, total - offset))
+        for offset in range(0, total, size)
+    ]
+
+
+def order_columns(order_by: Sequence[str] = ()) -> Tuple[str, ...]:
+    """ Returns the users columns to sort by: order_by first, then every
+    other column to break ties, so that rows are in a total order and
+    LIMIT/OFFSET ranges neither overlap nor skip rows
+
+    Args:
+        order_by: columns to sort by first
+    Raises:
+        ValueError if a column is not in USER_COLUMNS
+    """
+    if isinstance(order_by, str):
+        order_by = (order_by,)
+    unknown = [column for column in order_by if column not in USER_COLUMNS]
+    if unknown:
+        raise ValueError(f"unknown users columns: {', '.join(unknown)}")
+    order = tuple(dict.fromkeys(order_by))
+    return order + tuple(
+        column for column in USER_COLUMNS if column not in order
+    )
+
+
+def export_shard(
+        connect: Callable, offset: int, limit: int, order_by: Sequence[str],
+        path: str, batch_size: int = EXPORT_BATCH_SIZE
+) -> int:
+    """ Exports one offset range of the users table to its own file
+
+    Runs inside a worker process, so it opens its own connection.
+
+    Args:
+        connect: picklable callable returning a DB-API connection
+        offset: first row of the range
+        limit: number of rows in the range
+        order_by: columns giving the table a total order across shards,
+            as returned by order_columns()
+        path: file receiving the shard's redacted log lines
+        batch_size: number of rows fetched, formatted and written at once
+    Returns:
+        Number of rows exported
+    """
+    db = connect()
+    try:
+        with open(path, "w") as shard:
+            return export_users(
+                db, shard, batch_size,
+                f"SELECT * FROM users ORDER BY {', '.join(order_by)} "
+                f"LIMIT {limit} OFFSET {offset}"
+            )
+    finally:
+        db.close()
+
+
+def parallel_export(
+        workers: int, directory: str, batch_size: int = EXPORT_BATCH_SIZE,
+        order_by: Sequence[str] = (), connect: Callable = connect_db
+) -> List[str]:
+    """ Exports the users table across worker processes, one offset range
+    per process, each fetched, formatted and redacted independently
+
+    Args:
+        workers: number of worker processes
+        directory: directory receiving one users.<shard>.log per range
+        batch_size: number of rows fetched, formatted and written at once
+        order_by: columns to sort the table by first; the other columns
+            break ties (see order_columns())
+        connect: picklable callable returning a DB-API connection
+    Returns:
+        Shard file paths, in table order
+    Raises:
+        ValueError if order_by names a column not in USER_COLUMNS
+    """
+    order_by = order_columns(order_by)
+    db = connect()
+    try:
+        cursor = db.cursor()
+        cursor.execute("SELECT COUNT(*) FROM users")
+        total = cursor.fetchone()[0]
+        cursor.close()
+    finally:
+        db.close()
+
+    ranges = shard_ranges(total, workers)
+    paths = [
+        os.path.join(directory, f"users.{shard:04d}.log")
+        for shard in range(len(ranges))
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(export_shard, connect, offset, limit, order_by,
+                        shard_path, batch_size)
+            for (offset, limit), shard_path in zip(ranges, paths)
+        ]
+        for future in futures:
+            future.result()
+    return paths
+
+
+def merge_shards(paths: Iterable[str], stream: TextIO) -> None:
+    """ Concatenates shard files into stream, in order
+
+    Args:
+        paths: shard file paths, in table order
+        stream: text stream receiving the merged log lines
+    """
+    for shard_path in paths:
+        with open(shard_path) as shard:
+            shutil.copyfileobj(shard, stream)
+    stream.flush()
+
+
 def main() -> None:
     """ Main function
     """
-    db = get_db()
-    cursor = db.cursor()
-    cursor.execute("SELECT * FROM users")
-    logger = get_logger()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of export processes")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE,
+                        help="rows fetched and written per batch")
+    parser.add_argument("--order-by", default="",
+                        help="comma-separated columns to sort the table by "
+                        "first, out of " + ", ".join(USER_COLUMNS))
+    parser.add_argument("--shard-dir",
+                        help="keep per-shard files here instead of merging")
+    args = parser.parse_args()
+    order_by = [column for column in args.order_by.split(",") if column]
+    try:
+        order_columns(order_by)
+    except ValueError as e:
+        parser.error(str(e))
+    get_logger()
 
-    for item in cursor:
-        message = f"name={item[0]}; email={item[1]}; phone={item[2]}; ssn={item[3]}; password={item[4]}; ip={item[5]}; last_login={item[6]}; user_agent={item[7]};"  # nopep8
-        logger.info(message)
-    cursor.close()
-    db.close()
+    if args.workers <= 1:
+        with get_pool().connection() as db:
+            export_users(db, sys.stderr, args.batch_size)
+        return
+
+    if args.shard_dir:
+        os.makedirs(args.shard_dir, exist_ok=True)
+        parallel_export(args.workers, args.shard_dir, args.batch_size,
+                        order_by)
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        merge_shards(
+            parallel_export(args.workers, directory, args.batch_size,
+                            order_by),
+            sys.stderr
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+""" Bulk redaction of key=value; log files """
+import argparse
+import mmap
+from multiprocessing import Pool
+import os
+import sys
+import time
+from typing import BinaryIO, List, Sequence, Tuple
+from filtered_logger import PII_FIELDS, RedactingFormatter, get_redactor
+
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def chunk_ranges(path: str, chunk_size: int = CHUNK_SIZE) -> List[
+    Tuple[int, int]
+]:
+    """ Splits a file into (start, end) byte ranges of about chunk_size
+    bytes, each ending on a line boundary
+
+    Args:
+        path: the log file
+        chunk_size: target number of bytes per chunk
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    ranges = []
+    with open(path, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        start = 0
+        while start < size:
+            newline = data.find(b"\n", min(start + chunk_size, size) - 1)
+            end = size if newline == -1 else newline + 1
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def redact_chunk(
+        path: str, start: int, end: int, fields: Sequence[str],
+        redaction: str, separator: str
+) -> bytes:
+    """ Redacts one chunk of a log file, inside a worker process
+
+    The chunk is redacted in a single pass; a newline also ends a value so
+    that no redaction runs across lines.
+
+    Args:
+        path: the log file
+        start: offset of the first byte of the chunk
+        end: offset past the last byte of the chunk
+        fields: fields to obfuscate
+        redaction: string representing obfuscated fields
+        separator: character that separates all fields in a log line
+    Returns:
+        The redacted chunk
+    """
+    with open(path, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[start:end].decode("utf-8", "surrogateescape")
+    redact = get_redactor(tuple(fields), redaction, separator + "\n")
+    return redact(text).encode("utf-8", "surrogateescape")
+
+
+def _redact_job(job: Tuple) -> bytes:
+    """ Unpacks a redact_chunk() job for Pool.imap
+    """
+    return redact_chunk(*job)
+
+
+def redact_file(
+        pool: Pool, path: str, output: BinaryIO, fields: Sequence[str],
+        chunk_size: int = CHUNK_SIZE
+) -> int:
+    """ Redacts a log file chunk by chunk across the pool, writing the
+    chunks to output sequentially and in order
+
+    Args:
+        pool: worker processes
+        path: the log file
+        output: binary stream receiving the redacted file
+        fields: fields to obfuscate
+        chunk_size: target number of bytes per chunk
+    Returns:
+        Number of input bytes processed
+    """
+    jobs = [
+        (path, start, end, fields, RedactingFormatter.REDACTION,
+         RedactingFormatter.SEPARATOR)
+        for start, end in chunk_ranges(path, chunk_size)
+    ]
+    for chunk in pool.imap(_redact_job, jobs):
+        output.write(chunk)
+    return jobs[-1][2] if jobs else 0
+
+
+def main() -> None:
+    """ Main function
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("files", nargs="+", help="log files to redact")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="number of redaction processes")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help="bytes per chunk")
+    parser.add_argument("--fields", default=",".join(PII_FIELDS),
+                        help="comma separated fields to obfuscate")
+    parser.add_argument("--suffix", default=".redacted",
+                        help="suffix of the redacted copy of each file")
+    parser.add_argument("--stdout", action="store_true",
+                        help="write all files to stdout instead")
+    args = parser.parse_args()
+    fields = tuple(field for field in args.fields.split(",") if field)
+
+    total = 0
+    start = time.perf_counter()
+    with Pool(args.workers) as pool:
+        for path in args.files:
+            if args.stdout:
+                total += redact_file(pool, path, sys.stdout.buffer, fields,
+                                     args.chunk_size)
+                continue
+            with open(path + args.suffix, "wb") as output:
+                total += redact_file(pool, path, output, fields,
+                                     args.chunk_size)
+    elapsed = time.perf_counter() - start
+    print(f"redacted {total / 1e6:.1f} MB in {elapsed:.2f}s "
+          f"({total / 1e6 / elapsed:.1f} MB/sec)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
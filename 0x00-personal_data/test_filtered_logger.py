@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+""" Unit tests of filtered_logger
+"""
+import contextlib
+import functools
+import io
+import logging
+import os
+import queue
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import filtered_logger
+
+
+class TestFieldAutomaton(unittest.TestCase):
+    """ FieldAutomaton against the regex redactor, the reference
+    implementation
+    """
+
+    def regex_redact(self, fields, redaction, message, separator):
+        """ filter_datum() forced onto its regex alternation
+        """
+        filtered_logger.get_redactor.cache_clear()
+        with mock.patch.object(filtered_logger, "AUTOMATON_MIN_FIELDS",
+                               float("inf")):
+            try:
+                return filtered_logger.filter_datum(
+                    fields, redaction, message, separator
+                )
+            finally:
+                filtered_logger.get_redactor.cache_clear()
+
+    def test_fuzz(self):
+        """ Both redact random messages over random catalogs alike
+        """
+        rng = random.Random(0)
+        for _ in range(300):
+            # a tiny alphabet makes fields overlap and prefix each other
+            alphabet = rng.choice(("ab", "abc", "abcd_"))
+            separator = rng.choice(";,|.]")
+            redaction = rng.choice(("***", "", "x", r"\1", "[R]"))
+            fields = list({
+                "".join(rng.choices(alphabet, k=rng.randint(1, 5)))
+                for _ in range(rng.randint(1, 150))
+            })
+            automaton = filtered_logger.FieldAutomaton(
+                fields, redaction, separator
+            )
+            chars = alphabet + "=" + separator + " "
+            for _ in range(20):
+                message = "".join(
+                    rng.choices(chars, k=rng.randint(0, 60))
+                )
+                self.assertEqual(
+                    automaton(message),
+                    self.regex_redact(fields, redaction, message, separator),
+                    (fields, redaction, separator, message)
+                )
+
+
+class TestStructuredLogging(unittest.TestCase):
+    """ Structured (mapping) records through get_logger()
+    """
+
+    def tearDown(self):
+        logger = logging.getLogger("user_data")
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+
+    def log_dict(self, asynchronous: bool) -> str:
+        """ Logs one user row as a dict and returns the output
+        """
+        output = io.StringIO()
+        with contextlib.redirect_stderr(output):
+            logger = filtered_logger.get_logger(asynchronous=asynchronous)
+        logger.info({"name": "Bob", "email": "bob@dylan.com",
+                     "ip": "10.0.0.1"})
+        for handler in logger.handlers:
+            handler.flush()
+        return output.getvalue()
+
+    def test_sync(self):
+        """ The synchronous handler redacts a dict by key
+        """
+        output = self.log_dict(False)
+        self.assertIn("name=***; email=***; ip=10.0.0.1;", output)
+        self.assertNotIn("Bob", output)
+        self.assertNotIn("bob@dylan.com", output)
+
+    def test_async(self):
+        """ The asynchronous handler redacts a dict by key too
+        """
+        output = self.log_dict(True)
+        self.assertIn("name=***; email=***; ip=10.0.0.1;", output)
+        self.assertNotIn("Bob", output)
+        self.assertNotIn("bob@dylan.com", output)
+
+
+class Probe:
+    """ Log argument recording the threads that render it
+    """
+
+    def __init__(self):
+        self.threads = []
+
+    def __str__(self):
+        self.threads.append(threading.current_thread().name)
+        return "probe"
+
+
+class TestAsyncHandler(unittest.TestCase):
+    """ AsyncRedactingHandler only enqueues on the caller's thread
+    """
+
+    def setUp(self):
+        self.output = io.StringIO()
+        self.handler = filtered_logger.AsyncRedactingHandler(self.output)
+        self.logger = logging.getLogger("user_data.test")
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+
+    def test_formats_on_listener(self):
+        """ Message arguments are rendered by the listener thread
+        """
+        probe = Probe()
+        self.logger.warning("value=%s;", probe)
+        self.handler.flush()
+        self.assertEqual(probe.threads, ["user_data-log-listener"])
+        self.assertIn("value=probe;", self.output.getvalue())
+
+    def test_reused_row(self):
+        """ A row changed after being logged is written as logged
+        """
+        row = {"name": "Bob", "ip": "10.0.0.0"}
+        for i in range(3):
+            row["ip"] = f"10.0.0.{i}"
+            self.logger.warning(row)
+            self.logger.warning("ip=%(ip)s;", row)
+        row["ip"] = "changed"
+        self.handler.flush()
+        output = self.output.getvalue()
+        self.assertNotIn("changed", output)
+        for i in range(3):
+            self.assertEqual(output.count(f"ip=10.0.0.{i};"), 2)
+
+    def test_traceback(self):
+        """ Tracebacks are rendered and redacted by the listener
+        """
+        try:
+            raise ValueError("email=bob@dylan.com;")
+        except ValueError:
+            self.logger.exception("failed")
+        self.handler.flush()
+        output = self.output.getvalue()
+        self.assertIn("Traceback", output)
+        self.assertIn("ValueError: email=***;", output)
+
+
+def make_users_db(path: str, count: int):
+    """ Creates an SQLite users table of count rows sharing one email
+    """
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE users ({})".format(
+        ", ".join(filtered_logger.USER_COLUMNS)))
+    db.executemany(
+        "INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [("n", "same@example.com", "p", "s", "pw", f"10.0.0.{i}",
+          "2019-11-14", "agent") for i in range(count)]
+    )
+    db.commit()
+    db.close()
+
+
+class TestExportUsers(unittest.TestCase):
+    """ Export of the users table as redacted log lines
+    """
+
+    def tearDown(self):
+        for name in ("user_data", "export_progress"):
+            logger = logging.getLogger(name)
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+                handler.close()
+
+    def test_progress_apart(self):
+        """ Progress lines stay out of the dump, as main() writes it
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "users.db")
+            make_users_db(path, 5)
+            dump = io.StringIO()
+            progress = io.StringIO()
+            with contextlib.redirect_stderr(dump), \
+                    contextlib.redirect_stdout(progress):
+                filtered_logger.get_logger()
+                db = sqlite3.connect(path)
+                rows = filtered_logger.export_users(db, sys.stderr, 2)
+                db.close()
+        lines = dump.getvalue().splitlines()
+        self.assertEqual(rows, 5)
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(all("email=***;" in line for line in lines))
+        self.assertIn("exported 5 rows", progress.getvalue())
+
+
+class TestParallelExport(unittest.TestCase):
+    """ Sharded export of the users table
+    """
+
+    def test_order_columns(self):
+        """ Sort columns always cover every column, order_by first
+        """
+        self.assertEqual(filtered_logger.order_columns(),
+                         filtered_logger.USER_COLUMNS)
+        order = filtered_logger.order_columns(["ip", "email"])
+        self.assertEqual(order[:2], ("ip", "email"))
+        self.assertCountEqual(order, filtered_logger.USER_COLUMNS)
+        with self.assertRaises(ValueError):
+            filtered_logger.order_columns(["email; DROP TABLE users"])
+
+    def test_duplicate_emails(self):
+        """ Rows sharing the order_by column are exported exactly once
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "users.db")
+            make_users_db(path, 97)
+            paths = filtered_logger.parallel_export(
+                4, directory, 10, ["email"],
+                functools.partial(sqlite3.connect, path)
+            )
+            output = io.StringIO()
+            filtered_logger.merge_shards(paths, output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 97)
+        self.assertEqual(
+            sorted(line.split("ip=")[1].split(";")[0] for line in lines),
+            sorted(f"10.0.0.{i}" for i in range(97))
+        )
+
+
+class FakeConnection:
+    """ DB-API connection stand-in with a switchable health
+    """
+
+    def __init__(self):
+        self.healthy = True
+        self.closed = False
+
+    def is_connected(self) -> bool:
+        return self.healthy and not self.closed
+
+    def close(self):
+        self.closed = True
+
+
+class TestConnectionPool(unittest.TestCase):
+    """ ConnectionPool with a fake connector
+    """
+
+    def setUp(self):
+        self.opened = []
+        self.pool = filtered_logger.ConnectionPool(
+            self.connect, size=2, timeout=0.05
+        )
+
+    def connect(self) -> FakeConnection:
+        connection = FakeConnection()
+        self.opened.append(connection)
+        return connection
+
+    def test_reuse(self):
+        """ A released connection is checked out again
+        """
+        with self.pool.connection() as first:
+            pass
+        with self.pool.connection() as second:
+            self.assertIs(second, first)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_exhausted(self):
+        """ Callers wait for a free connection, up to timeout
+        """
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+        self.assertIsNot(first, second)
+        with self.assertRaises(queue.Empty):
+            self.pool.acquire()
+        threading.Timer(0.01, self.pool.release, (first,)).start()
+        self.pool.timeout = 5
+        self.assertIs(self.pool.acquire(), first)
+        self.assertEqual(len(self.opened), 2)
+
+    def test_unhealthy(self):
+        """ A broken connection is closed and replaced on checkout
+        """
+        with self.pool.connection() as first:
+            first.healthy = False
+        with self.pool.connection() as second:
+            self.assertIsNot(second, first)
+        self.assertTrue(first.closed)
+        self.assertEqual(len(self.opened), 2)
+
+    def test_metrics(self):
+        """ Checkouts, waits, connects and discards are counted
+        """
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+        with self.assertRaises(queue.Empty):
+            self.pool.acquire()
+        first.healthy = False
+        self.pool.release(second)
+        self.pool.release(first)
+        self.assertIs(self.pool.acquire(), second)
+        self.assertEqual(self.pool.metrics(), {
+            "checkouts": 4, "waits": 1, "connects": 2, "discarded": 1,
+            "open": 1, "idle": 0,
+        })
+        self.pool.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 """ Basic Auth class """
 from api.v1.auth.auth import Auth
+from api.v1.auth.credential_cache import CredentialCache
 import base64
 from typing import TypeVar
 from models.user import User
@@ -9,6 +10,11 @@ from models.user import User
 class BasicAuth(Auth):
     """ Basic Authenticator class that inherits from Auth()
     """
+    def __init__(self):
+        """ Initialize the cache of verified credentials
+        """
+        self.credential_cache = CredentialCache()
+
     def extract_base64_authorization_header(
             self, authorization_header: str
     ) -> str:
@@ -80,6 +86,10 @@ class BasicAuth(Auth):
         if not header:
             return None
 
+        user = self.credential_cache.get(header)
+        if user is not None:
+            return user
+
         base64_header = self.extract_base64_authorization_header(header)
         if not base64_header:
             return None
@@ -94,6 +104,9 @@ class BasicAuth(Auth):
         if credentials[0] is None or credentials[1] is None:
             return None
 
-        return self.user_object_from_credentials(
+        user = self.user_object_from_credentials(
             credentials[0], credentials[1]
         )
+        if user is not None:
+            self.credential_cache.put(header, user)
+        return user
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+""" Verified-credential cache of BasicAuth """
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+import time
+from typing import TypeVar
+from models.user import User
+
+
+CACHE_SIZE = int(os.getenv('BASIC_AUTH_CACHE_SIZE', '1024'))
+CACHE_TTL = float(os.getenv('BASIC_AUTH_CACHE_TTL', '60'))
+
+
+class CredentialCache():
+    """ Bounded LRU cache of verified Authorization headers, with a TTL
+
+    Entries are keyed by a keyed BLAKE2b digest of the header, under a
+    key drawn at random per cache, so the credentials themselves are
+    never kept. Each entry holds the id of the user, and the email and
+    password hash it was verified against. A hit is only served while
+    the stored user still has both, so changing User.password or
+    removing the user invalidates its entries.
+    """
+
+    def __init__(self, size: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        """ Initialize a cache of at most size entries, each valid for
+        ttl seconds
+        """
+        self.size = size
+        self.ttl = ttl
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "expired": 0,
+                        "invalidated": 0, "evicted": 0}
+
+    def _digest(self, header: str) -> bytes:
+        """ Keyed digest of an Authorization header
+        """
+        return hashlib.blake2b(header.encode(), key=self._key).digest()
+
+    def get(self, header: str) -> TypeVar('User'):
+        """ User verified for header, or None on a miss
+        """
+        if self.size <= 0:
+            return None
+        digest = self._digest(header)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.metrics["misses"] += 1
+                return None
+            user_id, email, password, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[digest]
+                self.metrics["expired"] += 1
+                self.metrics["misses"] += 1
+                return None
+            self._entries.move_to_end(digest)
+        user = User.get(user_id)
+        if user is None or user.email != email \
+                or user.password != password:
+            with self._lock:
+                if self._entries.get(digest) is entry:
+                    del self._entries[digest]
+                    self.metrics["invalidated"] += 1
+                self.metrics["misses"] += 1
+            return None
+        with self._lock:
+            self.metrics["hits"] += 1
+        return user
+
+    def put(self, header: str, user: TypeVar('User')):
+        """ Caches user as verified for header
+        """
+        if self.size <= 0:
+            return
+        digest = self._digest(header)
+        entry = (user.id, user.email, user.password,
+                 time.monotonic() + self.ttl)
+        with self._lock:
+            self._entries[digest] = entry
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+                self.metrics["evicted"] += 1
+
+    def clear(self):
+        """ Drops every entry
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        """ Number of entries
+        """
+        return len(self._entries)
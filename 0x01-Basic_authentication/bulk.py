@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+""" NDJSON bulk export and import of the .db_<Class>.json stores
+
+    ./bulk.py export User > users.ndjson
+    ./bulk.py import User users.ndjson
+"""
+import argparse
+import sys
+import time
+from models.ndjson import BATCH_SIZE, export_ndjson, import_ndjson, \
+    model_classes
+
+
+def main() -> None:
+    """ Main function
+    """
+    classes = model_classes()
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("model", choices=sorted(classes))
+    parser.add_argument("file", nargs="?", default="-",
+                        help="NDJSON file, default stdin or stdout")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="lines per write, objects per persistence step")
+    args = parser.parse_args()
+    cls = classes[args.model]
+
+    start = time.perf_counter()
+    count = 0
+    if args.command == "export":
+        output = sys.stdout if args.file == "-" else open(args.file, "w")
+        with output:
+            for chunk in export_ndjson(cls, True, args.batch_size):
+                output.write(chunk)
+                count += chunk.count("\n")
+    else:
+        source = sys.stdin if args.file == "-" else open(args.file)
+        with source:
+            count = import_ndjson(cls, source, args.batch_size)
+        cls.flush()
+    elapsed = time.perf_counter() - start
+    print("{}ed {} {} objects in {:.2f}s ({:.0f} objects/sec)".format(
+        args.command, count, args.model, elapsed,
+        count / elapsed if elapsed else 0), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
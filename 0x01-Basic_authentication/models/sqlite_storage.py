@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+""" SQLite storage backend of models.base.Base, used when
+BASE_STORAGE=sqlite
+
+Each class gets a table keeping every object as its JSON record, with an
+indexed column per INDEXED_ATTRIBUTES entry and an index on
+(created_at, id). The database runs in WAL mode, so several processes can
+share one file: readers never wait for the writer, and writers take turns.
+"""
+import json
+import os
+import sqlite3
+import threading
+from typing import Iterable, Iterator, List, Tuple, TypeVar
+
+
+SQLITE_PATH = os.getenv("BASE_SQLITE_PATH", ".db.sqlite3")
+BUSY_TIMEOUT = 30.0
+FETCH_SIZE = 1000
+COLUMN_TYPES = (str, int, float, type(None))
+
+
+class SQLiteStorage():
+    """ Objects of Base subclasses stored in one SQLite database
+
+    Connections are opened per thread. Every method takes the class of the
+    objects, whose table is created, or given its missing index columns,
+    on first use.
+    """
+
+    def __init__(self, file_path: str):
+        """ Initialize a storage on file_path, opened on first use
+        """
+        self.file_path = file_path
+        self._local = threading.local()
+        self._tables = set()
+
+    def connection(self) -> sqlite3.Connection:
+        """ Connection of the current thread, in autocommit mode
+
+        A process forked after the connection was opened, e.g. a
+        pre-forking server worker, opens its own.
+        """
+        pid, conn = getattr(self._local, "conn", (None, None))
+        if pid != os.getpid():
+            conn = sqlite3.connect(self.file_path, timeout=BUSY_TIMEOUT,
+                                   isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = (os.getpid(), conn)
+        return conn
+
+    def _write(self, sql: str, rows: Iterable[tuple]):
+        """ Runs sql once per row in a single transaction
+        """
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(sql, rows)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _table(self, cls: type) -> str:
+        """ Name of the table of cls, created or migrated if needed
+        """
+        table = cls.__name__
+        if table in self._tables:
+            return table
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS "{0}" (id TEXT PRIMARY KEY, '
+                'created_at TEXT NOT NULL, data TEXT NOT NULL)'.format(table))
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS "{0}_created_at" '
+                'ON "{0}" (created_at, id)'.format(table))
+            columns = {row[1] for row in conn.execute(
+                'PRAGMA table_info("{}")'.format(table))}
+            for attribute in cls.INDEXED_ATTRIBUTES:
+                column = "ix_" + attribute
+                if column not in columns:
+                    conn.execute('ALTER TABLE "{}" ADD COLUMN "{}"'.format(
+                        table, column))
+                    conn.execute(
+                        'UPDATE "{}" SET "{}" = json_extract(data, ?)'.format(
+                            table, column), ("$." + attribute,))
+                conn.execute(
+                    'CREATE INDEX IF NOT EXISTS "{0}_{1}" ON "{0}" ("{1}")'
+                    .format(table, column))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        self._tables.add(table)
+        return table
+
+    @staticmethod
+    def _row(cls: type, obj: TypeVar('Base')) -> tuple:
+        """ Row of obj: id, created_at, JSON record, indexed values
+        """
+        record = obj.to_json(True)
+        values = []
+        for attribute in cls.INDEXED_ATTRIBUTES:
+            value = getattr(obj, attribute, None)
+            # other types stay NULL: search() filters them in Python
+            values.append(value if type(value) in COLUMN_TYPES else None)
+        return (obj.id, record.get("created_at"), json.dumps(record),
+                *values)
+
+    def _insert(self, cls: type, conflict: str) -> str:
+        """ INSERT OR <conflict> statement of a _row() of cls
+        """
+        columns = ["id", "created_at", "data"] + [
+            '"ix_{}"'.format(attribute)
+            for attribute in cls.INDEXED_ATTRIBUTES
+        ]
+        return 'INSERT OR {} INTO "{}" ({}) VALUES ({})'.format(
+            conflict, self._table(cls), ", ".join(columns),
+            ", ".join("?" * len(columns)))
+
+    def save(self, cls: type, objs: List[TypeVar('Base')]):
+        """ Inserts or replaces objs, in one transaction
+        """
+        self._write(self._insert(cls, "REPLACE"),
+                    (self._row(cls, obj) for obj in objs))
+
+    def import_if_empty(self, cls: type,
+                        objs: Iterable[TypeVar('Base')]) -> int:
+        """ Inserts objs if the table of cls is empty, checked in the same
+        transaction, so that of several processes starting together only
+        one imports; rows already there are never replaced
+
+        Returns:
+            Number of objects inserted
+        """
+        if self.count(cls):
+            return 0
+        sql = self._insert(cls, "IGNORE")
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            inserted = 0
+            if conn.execute('SELECT 1 FROM "{}" LIMIT 1'.format(
+                    self._table(cls))).fetchone() is None:
+                inserted = conn.executemany(
+                    sql, (self._row(cls, obj) for obj in objs)).rowcount
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return inserted
+
+    def remove(self, cls: type, obj_id: str):
+        """ Deletes the object with id obj_id
+        """
+        self._write('DELETE FROM "{}" WHERE id = ?'.format(self._table(cls)),
+                    [(obj_id,)])
+
+    def count(self, cls: type) -> int:
+        """ Number of stored objects of cls
+        """
+        return self.connection().execute(
+            'SELECT COUNT(*) FROM "{}"'.format(self._table(cls))
+        ).fetchone()[0]
+
+    def get(self, cls: type, obj_id: str) -> TypeVar('Base'):
+        """ Object with id obj_id, or None
+        """
+        row = self.connection().execute(
+            'SELECT data FROM "{}" WHERE id = ?'.format(self._table(cls)),
+            (obj_id,)).fetchone()
+        return None if row is None else cls(**json.loads(row[0]))
+
+    def search(self, cls: type, attributes: dict) -> List[TypeVar('Base')]:
+        """ Objects whose indexed attributes match attributes; the other
+        attributes are left for the caller to check
+        """
+        table = self._table(cls)
+        where = []
+        params = []
+        for attribute, value in attributes.items():
+            if attribute in cls.INDEXED_ATTRIBUTES \
+                    and type(value) in COLUMN_TYPES:
+                where.append('"ix_{}" IS ?'.format(attribute))
+                params.append(value)
+        sql = 'SELECT data FROM "{}"'.format(table)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return [cls(**json.loads(data)) for data, in
+                self.connection().execute(sql, params)]
+
+    def page(self, cls: type, limit: int, after: Tuple[str, str] = None
+             ) -> Tuple[List[TypeVar('Base')], Tuple[str, str]]:
+        """ Keyset pagination over (created_at, id), as Base.page()
+        """
+        sql = 'SELECT created_at, id, data FROM "{}"'.format(self._table(cls))
+        params = []
+        if after is not None:
+            sql += " WHERE (created_at, id) > (?, ?)"
+            params.extend(after)
+        sql += " ORDER BY created_at, id LIMIT ?"
+        params.append(limit + 1)
+        rows = self.connection().execute(sql, params).fetchall()
+        page = [cls(**json.loads(data)) for _, _, data in rows[:limit]]
+        next_key = tuple(rows[limit - 1][:2]) if len(rows) > limit else None
+        return page, next_key
+
+    def iter_records(self, cls: type) -> Iterator[dict]:
+        """ JSON records of all objects of cls, FETCH_SIZE rows at a time
+        """
+        cursor = self.connection().execute(
+            'SELECT data FROM "{}" ORDER BY rowid'.format(self._table(cls)))
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                return
+            for data, in rows:
+                yield json.loads(data)
+
+
+STORE = SQLiteStorage(SQLITE_PATH)
@@ -71,9 +71,9 @@ def before_request():
         request
     ) is None:
         abort(401)
-    if auth.current_user(request) is None:
+    request.current_user = auth.request_user(request)
+    if request.current_user is None:
         abort(403)
-    request.current_user = auth.current_user(request)
 
 
 if __name__ == "__main__":
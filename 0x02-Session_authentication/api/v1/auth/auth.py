@@ -5,6 +5,9 @@ from typing import List, TypeVar
 import os
 
 
+USER_CACHE_KEY = 'api.auth.current_user'
+
+
 class Auth:
     """ Auth class
     """
@@ -40,6 +43,21 @@ class Auth:
         """
         return None
 
+    def request_user(self, request=None) -> TypeVar('User'):
+        """ current_user() of a request, resolved once per request
+
+        The result, None included, is kept in the WSGI environ of the
+        request, so calling it again within the same request does not
+        run the authentication again, whatever the backend.
+        """
+        if request is None:
+            return None
+        cache = request.environ.get(USER_CACHE_KEY)
+        if cache is None or cache[0] is not self:
+            cache = (self, self.current_user(request))
+            request.environ[USER_CACHE_KEY] = cache
+        return cache[1]
+
     def session_cookie(self, request=None):
         """ Returns a cookie value from a request
         """
@@ -2,18 +2,89 @@
 """ Module of Users views
 """
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+import base64
+import binascii
+from flask import Response, abort, jsonify, request
 from models.user import User
 
 
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def json_response(encoded: str) -> Response:
+    """ Response carrying an already encoded JSON document
+    """
+    return Response(encoded + "\n", mimetype="application/json")
+
+
+def encode_cursor(key: tuple) -> str:
+    """ Opaque cursor for a (created_at, id) pagination key
+    """
+    raw = "{}|{}".format(*key).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """ (created_at, id) pagination key of a cursor, None if invalid
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    key = tuple(raw.split("|", 1))
+    return key if len(key) == 2 else None
+
+
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit: page size, at most MAX_PAGE_SIZE
+      - cursor: X-Next-Cursor header of the previous page
+      - fields: comma separated attributes to return
     Return:
-      - list of all User objects JSON represented
+      - list of all User objects JSON represented, or one page of them,
+        ordered by creation, when limit or cursor is given
+      - 400 if limit or cursor is invalid
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    fields = request.args.get('fields')
+    if fields is not None:
+        fields = [field for field in fields.split(",") if field]
+
+    def render(users):
+        if fields is None:
+            # cached per user until it changes
+            return json_response(
+                "[" + ", ".join(user.to_json_str() for user in users) + "]")
+        projected = []
+        for user in users:
+            user_json = user.to_json()
+            projected.append(
+                {k: user_json[k] for k in fields if k in user_json})
+        return jsonify(projected)
+
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    if limit is None and cursor is None:
+        return render(User.all())
+
+    try:
+        limit = DEFAULT_PAGE_SIZE if limit is None else int(limit)
+    except ValueError:
+        limit = 0
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        return jsonify({'error': "Wrong limit"}), 400
+    after = None
+    if cursor is not None:
+        after = decode_cursor(cursor)
+        if after is None:
+            return jsonify({'error': "Wrong cursor"}), 400
+    users, next_key = User.page(limit, after)
+    response = render(users)
+    if next_key is not None:
+        response.headers['X-Next-Cursor'] = encode_cursor(next_key)
+    return response
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -30,11 +101,11 @@ def view_one_user(user_id: str = None) -> str:
     if user_id == 'me' and request.current_user is None:
         abort(404)
     if user_id == 'me' and request.current_user is not None:
-        return jsonify(request.current_user.to_json())
+        return json_response(request.current_user.to_json_str())
     user = User.get(user_id)
     if user is None:
         abort(404)
-    return jsonify(user.to_json())
+    return json_response(user.to_json_str())
 
 
 @app_views.route('/users/<user_id>', methods=['DELETE'], strict_slashes=False)
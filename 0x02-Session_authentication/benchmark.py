@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+""" Storage benchmark for models.base
+
+Each suite builds synthetic User objects in a temporary directory, so the
+.db_*.json files of the working directory are never touched, and prints
+its measurements as JSON.
+"""
+import argparse
+import base64
+from datetime import datetime
+import itertools
+from multiprocessing import Pool
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+import models.base
+from models.base import DATA, TIMESTAMP_FORMAT, parse_timestamp
+from models.user import User
+
+
+SIZES = (10000, 100000, 1000000)
+THREADS = (1, 4, 16)
+PROCESSES = (1, 2, 4)
+STRESS_SECONDS = 3.0
+LOAD_SCRIPT = """
+import json, resource, time
+import models.base
+from models.user import User
+start = time.perf_counter()
+User.load_from_file()
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "startup_sec": round(elapsed, 3),
+    "peak_rss_mb": round(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+}))
+"""
+
+
+class DictRecord():
+    """ A user laid out in a per-object __dict__, as User was before
+    __slots__, holding the very same attribute values
+    """
+
+    def __init__(self, user: User):
+        """ Copy the attributes of user
+        """
+        for key in user._attribute_names():
+            setattr(self, key, getattr(user, key))
+
+
+def make_user(i: int) -> User:
+    """ Builds the i-th synthetic user without persisting it
+    """
+    user = User(email="user{}@example.com".format(i),
+                first_name="First{}".format(i),
+                last_name="Last{}".format(i))
+    user.password = "pwd{}".format(i)
+    return user
+
+
+def make_users(count: int) -> List[User]:
+    """ Builds count users without persisting them
+    """
+    return [make_user(i) for i in range(count)]
+
+
+def populate(count: int) -> List[User]:
+    """ Stores count users in memory and rebuilds the indexes
+    """
+    users = make_users(count)
+    DATA["User"] = {user.id: user for user in users}
+    User._reindex()
+    return users
+
+
+def write_store(count: int):
+    """ Writes .db_User.json with count synthetic records, without
+    building User objects
+    """
+    stamp = time.strftime(TIMESTAMP_FORMAT)
+    records = {}
+    for i in range(count):
+        obj_id = "{:08d}-0000-4000-8000-000000000000".format(i)
+        records[obj_id] = {
+            "id": obj_id, "created_at": stamp, "updated_at": stamp,
+            "email": "user{}@example.com".format(i),
+            "_password": "0" * 64, "first_name": "First{}".format(i),
+            "last_name": "Last{}".format(i),
+        }
+    with open(".db_User.json", "w") as f:
+        json.dump(records, f)
+
+
+def per_sec(func: Callable, calls: int) -> float:
+    """ Returns how many times per second func can be called
+    """
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return calls / (time.perf_counter() - start)
+
+
+def bench_search(objects: int) -> Dict:
+    """ User.search({"email": ...}) with and without the email index
+    """
+    users = populate(objects)
+    emails = [random.choice(users).email for _ in range(1000)]
+    results = {}
+    for label, attributes in (("indexed", ("email",)), ("linear", ())):
+        User.INDEXED_ATTRIBUTES = attributes
+        User._reindex()
+        calls = 1000 if attributes else 5
+        lookups = iter(emails)
+        rate = per_sec(lambda: User.search({"email": next(lookups)}), calls)
+        results[label] = {"lookups_per_sec": round(rate, 1),
+                          "us_per_lookup": round(1e6 / rate, 2)}
+    User.INDEXED_ATTRIBUTES = ("email",)
+    return results
+
+
+def bench_saves(objects: int) -> Dict:
+    """ saves/sec of new users with full-file, journal and snapshot
+    persistence, for each store size in SIZES up to objects
+    """
+    results = {}
+    for size in (size for size in SIZES if size <= objects):
+        populate(size)
+        User.save_to_file()
+        results[size] = {}
+        for mode, calls in (("file", 3), ("journal", 1000),
+                            ("snapshot", 200)):
+            models.base.PERSISTENCE = mode
+            # as load_from_file() would in this mode
+            User._reindex()
+            users = iter(make_users(calls))
+            rate = per_sec(lambda: next(users).save(), calls)
+            User.flush()
+            results[size][mode] = {"saves_per_sec": round(rate, 1)}
+    return results
+
+
+def bench_load(objects: int) -> Dict:
+    """ User.load_from_file() startup time and peak RSS, eager and lazy,
+    each in a fresh interpreter
+    """
+    write_store(objects)
+    project = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for mode, lazy in (("eager", "0"), ("lazy", "1")):
+        env = dict(os.environ, BASE_LAZY_LOAD=lazy, PYTHONPATH=project)
+        output = subprocess.run([sys.executable, "-c", LOAD_SCRIPT],
+                                env=env, capture_output=True, text=True,
+                                check=True).stdout
+        results[mode] = json.loads(output)
+    stamp = time.strftime(TIMESTAMP_FORMAT)
+    results["timestamp_parse_per_sec"] = {
+        "strptime": round(per_sec(
+            lambda: datetime.strptime(stamp, TIMESTAMP_FORMAT), 100000)),
+        "parse_timestamp": round(per_sec(
+            lambda: parse_timestamp(stamp), 100000)),
+    }
+    return results
+
+
+def bench_memory(objects: int) -> Dict:
+    """ Bytes per user held in memory, slotted User against the same
+    values in a __dict__
+    """
+    results = {}
+    for label, wrap in (("slots", lambda user: user), ("dict", DictRecord)):
+        records = []
+        tracemalloc.start()
+        for i in range(objects):
+            records.append(wrap(make_user(i)))
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        shell = sys.getsizeof(records[0])
+        if hasattr(records[0], "__dict__"):
+            shell += sys.getsizeof(records[0].__dict__)
+        results[label] = {
+            "bytes_per_object": round(size / objects, 1),
+            "object_bytes": shell,
+        }
+        del records
+    return results
+
+
+def bench_pages(objects: int) -> Dict:
+    """ One page of 100 users through User.page() against listing every
+    user, as GET /api/v1/users does without limit
+    """
+    populate(objects)
+    keys = User._order().keys
+    cursors = iter(random.choice(keys) for _ in range(1000))
+    rate = per_sec(lambda: [u.to_json() for u in User.page(
+        100, next(cursors))[0]], 1000)
+    full = per_sec(lambda: [u.to_json() for u in User.all()], 1)
+    return {
+        "page_100": {"ms_per_request": round(1000 / rate, 3)},
+        "all": {"ms_per_request": round(1000 / full, 3)},
+    }
+
+
+def stress(users: List[User], threads: int, seconds: float) -> Dict:
+    """ Runs threads workers for seconds on a 45% get, 45% search by email,
+    5% update, 5% create mix, and checks the store stayed consistent
+    """
+    initial = User.count()
+    serials = itertools.count(10 ** 9 + initial)
+    ops = []
+    created = []
+    errors = []
+    deadline = time.perf_counter() + seconds
+
+    def worker(seed: int):
+        rng = random.Random(seed)
+        count = 0
+        try:
+            while time.perf_counter() < deadline:
+                draw = rng.random()
+                user = rng.choice(users)
+                if draw < 0.45:
+                    assert User.get(user.id) is user
+                elif draw < 0.9:
+                    assert User.search({"email": user.email}) == [user]
+                elif draw < 0.95:
+                    user.first_name = "Updated{}".format(count)
+                    user.save()
+                else:
+                    new_user = make_user(next(serials))
+                    new_user.save()
+                    created.append(new_user)
+                count += 1
+        except Exception as e:
+            errors.append(repr(e))
+        ops.append(count)
+
+    workers = [threading.Thread(target=worker, args=(i,))
+               for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    User.flush()
+    if User.count() != initial + len(created):
+        errors.append("count drifted")
+    if any(User.search({"email": u.email}) != [u] for u in created):
+        errors.append("index out of sync")
+    stored = {record["id"] for record in User._iter_stored_records()}
+    if len(stored) != User.count():
+        errors.append("file out of sync")
+    return {"ops_per_sec": round(sum(ops) / seconds, 1),
+            "errors": errors[:5]}
+
+
+def bench_concurrency(objects: int) -> Dict:
+    """ Mixed read/write throughput for each thread count in THREADS, with
+    write-behind persistence snapshotting the store concurrently
+    """
+    users = populate(objects)
+    User.save_to_file()
+    models.base.PERSISTENCE = "write_behind"
+    models.base.WRITE_BEHIND_INTERVAL = 0.1
+    return {threads: stress(users, threads, STRESS_SECONDS)
+            for threads in THREADS}
+
+
+def search_worker(job: tuple) -> int:
+    """ Searches users by email for seconds, in a worker process, and
+    returns the number of searches
+    """
+    emails, seconds = job
+    count = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        User.search({"email": emails[count % len(emails)]})
+        count += 1
+    return count
+
+
+def bench_storage(objects: int) -> Dict:
+    """ Searches by email/sec against the in-process JSON store, and
+    against the SQLite backend shared by each process count in PROCESSES
+    """
+    users = make_users(objects)
+    emails = [random.choice(users).email for _ in range(1000)]
+    results = {}
+    DATA["User"] = {user.id: user for user in users}
+    User._reindex()
+    results["json"] = {1: round(
+        search_worker((emails, STRESS_SECONDS)) / STRESS_SECONDS, 1)}
+    models.base.STORAGE = "sqlite"
+    start = time.perf_counter()
+    for i in range(0, objects, 10000):
+        User.save_many(users[i:i + 10000])
+    results["sqlite_inserts_per_sec"] = round(
+        objects / (time.perf_counter() - start), 1)
+    del users
+    results["sqlite"] = {}
+    for processes in PROCESSES:
+        with Pool(processes) as pool:
+            counts = pool.map(search_worker,
+                              [(emails, STRESS_SECONDS)] * processes)
+        results["sqlite"][processes] = round(sum(counts) / STRESS_SECONDS, 1)
+    models.base.STORAGE = "json"
+    return results
+
+
+def cpu_ms(func: Callable) -> float:
+    """ CPU time of one call of func, in milliseconds
+    """
+    start = time.process_time()
+    func()
+    return round((time.process_time() - start) * 1000, 1)
+
+
+def bench_listing(objects: int) -> Dict:
+    """ CPU per full listing of the users: serializing every user as
+    to_json() did before the cache, then from a cold and a warm cache,
+    and GET /api/v1/users warm; and traced bytes per user once loaded,
+    after save_to_file() and after a listing
+    """
+    from api.v1.app import app
+    client = app.test_client()
+    tracemalloc.start()
+    users = populate(objects)
+    memory = {"loaded": tracemalloc.get_traced_memory()[0]}
+    User.save_to_file()
+    memory["after_save_to_file"] = tracemalloc.get_traced_memory()[0]
+    client.get("/api/v1/users")
+    memory["after_listing"] = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del users
+    users = populate(objects)
+    results = {
+        "uncached": cpu_ms(lambda: json.dumps(
+            [user._build_json(False) for user in users])),
+        "cold_cache": cpu_ms(lambda: "[" + ", ".join(
+            user.to_json_str() for user in users) + "]"),
+        "warm_cache": cpu_ms(lambda: "[" + ", ".join(
+            user.to_json_str() for user in users) + "]"),
+        "GET /api/v1/users": cpu_ms(lambda: client.get("/api/v1/users")),
+    }
+    return {"cpu_ms": results, "bytes_per_object": {
+        label: round(size / objects, 1) for label, size in memory.items()
+    }}
+
+
+def bench_auth(objects: int) -> Dict:
+    """ current_user() calls per GET /api/v1/users/me with each
+    authentication backend, microseconds per request and per
+    current_user() call, and the hits and misses of the BasicAuth
+    credential cache
+    """
+    from flask import request
+    from api.v1 import app as api
+    from api.v1.auth.basic_auth import BasicAuth
+    from api.v1.auth.credential_cache import CredentialCache
+    from api.v1.auth.session_auth import SessionAuth
+    from api.v1.auth.session_exp_auth import SessionExpAuth
+    from api.v1.auth.session_db_auth import SessionDBAuth
+    user = populate(objects)[0]
+    session_name = os.environ.setdefault("SESSION_NAME", "_my_session_id")
+    client = api.app.test_client(use_cookies=False)
+    credentials = base64.b64encode(b"user0@example.com:pwd0").decode()
+    results = {}
+    for name, auth_class in (("basic_auth", BasicAuth),
+                             ("basic_auth_uncached", BasicAuth),
+                             ("session_auth", SessionAuth),
+                             ("session_exp_auth", SessionExpAuth),
+                             ("session_db_auth", SessionDBAuth)):
+        auth = auth_class()
+        if auth_class is BasicAuth:
+            headers = {"Authorization": "Basic " + credentials}
+            if name == "basic_auth_uncached":
+                auth.credential_cache = CredentialCache(size=0)
+        else:
+            headers = {"Cookie": "{}={}".format(
+                session_name, auth.create_session(user.id))}
+        calls = []
+        resolve = auth.current_user
+        auth.current_user = lambda request=None: (
+            calls.append(1) or resolve(request))
+        api.auth = auth
+        assert client.get("/api/v1/users/me", headers=headers).status_code \
+            == 200
+        del calls[:]
+        requests = 1000
+        rate = per_sec(lambda: client.get("/api/v1/users/me",
+                                          headers=headers), requests)
+        results[name] = {
+            "current_user_calls_per_request": len(calls) / requests,
+            "us_per_request": round(1e6 / rate, 1),
+        }
+        with api.app.test_request_context(headers=headers):
+            rate = per_sec(lambda: resolve(request), 10000)
+        results[name]["us_per_current_user"] = round(1e6 / rate, 2)
+        if auth_class is BasicAuth:
+            results[name]["cache"] = dict(auth.credential_cache.metrics)
+    api.auth = None
+    return results
+
+
+def find_errors(results) -> List[str]:
+    """ Every error reported under an "errors" key of results
+    """
+    if not isinstance(results, dict):
+        return []
+    errors = list(results.get("errors") or [])
+    for key, value in results.items():
+        if key != "errors":
+            errors.extend(find_errors(value))
+    return errors
+
+
+SUITES = {
+    "auth": bench_auth,
+    "concurrency": bench_concurrency,
+    "listing": bench_listing,
+    "load": bench_load,
+    "memory": bench_memory,
+    "pages": bench_pages,
+    "saves": bench_saves,
+    "search": bench_search,
+    "storage": bench_storage,
+}
+
+
+def main() -> None:
+    """ Main function
+
+    Exits with status 1 when a suite reports errors, such as the
+    consistency checks of stress()
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("suite", choices=sorted(SUITES))
+    parser.add_argument("--objects", type=int, default=1000000,
+                        help="number of stored objects")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            results = SUITES[args.suite](args.objects)
+        finally:
+            os.chdir(cwd)
+    print(json.dumps({
+        "suite": args.suite,
+        "objects": args.objects,
+        "python": platform.python_version(),
+        "results": results,
+    }, indent=2))
+    errors = find_errors(results)
+    if errors:
+        sys.exit("{} error(s): {}".format(len(errors), "; ".join(errors)))
+
+
+if __name__ == "__main__":
+    main()
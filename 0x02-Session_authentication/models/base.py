@@ -1,39 +1,654 @@
 #!/usr/bin/env python3
 """ Base module
 """
+from bisect import bisect_left, bisect_right, insort
 from datetime import datetime
-from typing import TypeVar, List, Iterable
+from typing import TypeVar, List, Iterable, Iterator, Tuple
 from os import path
+import atexit
+import codecs
 import json
+import os
+import sys
+import threading
+import time
 import uuid
+from models import sqlite_storage
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+STORAGE = os.getenv("BASE_STORAGE", "json")
+PERSISTENCE = os.getenv("BASE_PERSISTENCE", "file")
+JOURNAL_THRESHOLD = int(os.getenv("BASE_JOURNAL_THRESHOLD", "1000"))
+WRITE_BEHIND_INTERVAL = float(os.getenv("BASE_WRITE_BEHIND_INTERVAL", "1"))
+WRITE_BEHIND_THRESHOLD = int(os.getenv("BASE_WRITE_BEHIND_THRESHOLD", "100"))
+LAZY_LOAD = os.getenv("BASE_LAZY_LOAD", "0") == "1"
+LOAD_CHUNK_SIZE = 1 << 20
+CACHE_ATTRIBUTES = ('_json_cache', '_json_version')
 DATA = {}
+INDEXES = {}
+ORDERS = {}
+ENCODED = {}
+JOURNAL_SIZES = {}
+
+
+def parse_timestamp(value: str) -> datetime:
+    """ Parse a TIMESTAMP_FORMAT string
+
+    datetime.fromisoformat() parses this fixed layout several times
+    faster than strptime(), which remains the fallback for anything else.
+    """
+    if len(value) == 19 and value[10] == 'T' and value[13] == ':' \
+            and value[16] == ':':
+        return datetime.fromisoformat(value)
+    return datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+class LazyRecords(dict):
+    """ Objects of a class by id, kept as raw JSON records until first
+    accessed, used by load_from_file() when BASE_LAZY_LOAD=1
+
+    Reading a record (get, [], values, items) turns it into an object of
+    the class in place. Turning a record into an object, and writing to
+    the mapping, take a mutex of the mapping: lock-free readers such as
+    Base.get() all get the same object for an id, and a record removed
+    meanwhile is never written back.
+    """
+
+    def __init__(self, cls: type):
+        """ Initialize an empty mapping for cls
+        """
+        super().__init__()
+        self.cls = cls
+        self._lock = threading.Lock()
+
+    def _materialize(self, obj_id: str) -> TypeVar('Base'):
+        """ Object by id, turned from its record if still raw, or None if
+        it was removed
+        """
+        with self._lock:
+            obj = dict.get(self, obj_id)
+            if type(obj) is dict:
+                obj = self.cls(**obj)
+                dict.__setitem__(self, obj_id, obj)
+            return obj
+
+    def __getitem__(self, obj_id: str) -> TypeVar('Base'):
+        """ Object by id, materialized on first access
+        """
+        obj = dict.__getitem__(self, obj_id)
+        if type(obj) is dict:
+            obj = self._materialize(obj_id)
+            if obj is None:
+                raise KeyError(obj_id)
+        return obj
+
+    def get(self, obj_id: str, default=None) -> TypeVar('Base'):
+        """ Object by id, or default
+        """
+        obj = dict.get(self, obj_id)
+        if type(obj) is dict:
+            obj = self._materialize(obj_id)
+        return default if obj is None else obj
+
+    def __setitem__(self, obj_id: str, obj):
+        """ Store an object, or a raw record, by id
+        """
+        with self._lock:
+            dict.__setitem__(self, obj_id, obj)
+
+    def __delitem__(self, obj_id: str):
+        """ Remove an object by id
+        """
+        with self._lock:
+            dict.__delitem__(self, obj_id)
+
+    def pop(self, obj_id: str, *default):
+        """ Remove an object by id and return it, raw or not
+        """
+        with self._lock:
+            return dict.pop(self, obj_id, *default)
+
+    def values(self) -> List[TypeVar('Base')]:
+        """ All objects, materialized
+        """
+        return [obj for obj in map(self.get, list(self)) if obj is not None]
+
+    def items(self) -> List[tuple]:
+        """ All (id, object) pairs, materialized
+        """
+        obj_ids = list(self)
+        return [(obj_id, obj) for obj_id, obj in
+                zip(obj_ids, map(self.get, obj_ids)) if obj is not None]
+
+
+def iter_store(file_path: str) -> Iterator[Tuple[str, dict]]:
+    """ Yield the (id, record) pairs of a .db_<Class>.json file one at a
+    time
+
+    The file is read and decoded LOAD_CHUNK_SIZE bytes at a time, and each
+    record is parsed on its own, so neither the whole text nor the whole
+    document dictionary is ever held in memory.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    whitespace = " \t\r\n"
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        eof = False
+        buffer = ""
+        pos = 0
+
+        def refill() -> bool:
+            nonlocal eof, buffer, pos
+            if eof:
+                return False
+            chunk = f.read(LOAD_CHUNK_SIZE)
+            eof = len(chunk) < LOAD_CHUNK_SIZE
+            buffer = buffer[pos:] + utf8.decode(chunk, final=eof)
+            pos = 0
+            return True
+
+        def next_char() -> str:
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos] in whitespace:
+                    pos += 1
+                if pos < len(buffer):
+                    return buffer[pos]
+                if not refill():
+                    raise ValueError("unexpected end of " + file_path)
+
+        def next_value():
+            nonlocal pos
+            next_char()
+            while True:
+                # a value running to the end of the buffer may be cut
+                # short by the chunk boundary: read more and parse again
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    if end < len(buffer) or not refill():
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if not refill():
+                        raise
+
+        if next_char() != '{':
+            raise ValueError("{} is not a JSON object".format(file_path))
+        pos += 1
+        if next_char() == '}':
+            return
+        while True:
+            obj_id = next_value()
+            if next_char() != ':':
+                raise ValueError("malformed " + file_path)
+            pos += 1
+            yield obj_id, next_value()
+            separator = next_char()
+            pos += 1
+            if separator == '}':
+                return
+            if separator != ',':
+                raise ValueError("malformed " + file_path)
+
+
+def write_store(file_path: str, records: Iterable[Tuple[str, str]]):
+    """ Atomically replace a .db_<Class>.json file
+
+    Args:
+        file_path: the file
+        records: (id, JSON encoded record) pairs
+    """
+    with open(file_path + ".tmp", 'w') as f:
+        f.write("{")
+        separator = ""
+        for obj_id, encoded in records:
+            f.write(separator + json.dumps(obj_id) + ": " + encoded)
+            separator = ", "
+        f.write("}")
+    os.replace(file_path + ".tmp", file_path)
+
+
+def _encode(obj) -> str:
+    """ Encoded record of an object, or of a raw record never accessed
+    since a lazy load
+    """
+    if type(obj) is dict:
+        return json.dumps(obj)
+    return obj.to_json_str(True)
+
+
+def _attribute(obj, attribute: str):
+    """ Value of an attribute of an object or of a raw JSON record
+    """
+    if type(obj) is dict:
+        return obj.get(attribute)
+    return getattr(obj, attribute, None)
+
+
+class Index():
+    """ Secondary hash index mapping the values of one attribute to the
+    ids of the objects holding them
+    """
+
+    def __init__(self, attribute: str):
+        """ Initialize an empty index on attribute
+        """
+        self.attribute = attribute
+        self.entries = {}
+        self.values = {}
+
+    def add(self, obj_id: str, value):
+        """ Index obj_id under value, replacing the entry of a previous
+        save
+        """
+        if obj_id in self.values:
+            old_value = self.values[obj_id]
+            if old_value is value or old_value == value:
+                return
+            self.discard(obj_id)
+        try:
+            self.entries.setdefault(value, {})[obj_id] = None
+        except TypeError:
+            return
+        self.values[obj_id] = value
+
+    def discard(self, obj_id: str):
+        """ Drop the entry of an object
+        """
+        if obj_id not in self.values:
+            return
+        value = self.values.pop(obj_id)
+        bucket = self.entries[value]
+        del bucket[obj_id]
+        if not bucket:
+            del self.entries[value]
+
+    def lookup(self, value) -> dict:
+        """ Ids indexed under value (as dict keys), or None when value
+        cannot be looked up in a hash index
+        """
+        try:
+            return self.entries.get(value, {})
+        except TypeError:
+            return None
+
+
+class OrderedIndex():
+    """ Ids of the objects of a class sorted by (created_at, id), the
+    stable ordering used for keyset pagination
+    """
+
+    def __init__(self):
+        """ Initialize an empty index
+        """
+        self.keys = []
+        self.by_id = {}
+
+    @staticmethod
+    def key(obj_id: str, created_at) -> Tuple[str, str]:
+        """ Sort key of an object, created_at being a datetime or, for a
+        raw record, a TIMESTAMP_FORMAT string
+        """
+        if type(created_at) is datetime:
+            created_at = created_at.isoformat(timespec='seconds')
+        return (created_at or "", obj_id)
+
+    def add(self, obj_id: str, created_at):
+        """ Insert obj_id, moving it if its created_at changed
+        """
+        key = self.key(obj_id, created_at)
+        if self.by_id.get(obj_id) == key:
+            return
+        self.discard(obj_id)
+        # new objects sort last, so insort mostly appends
+        insort(self.keys, key)
+        self.by_id[obj_id] = key
+
+    def discard(self, obj_id: str):
+        """ Drop the entry of an object
+        """
+        key = self.by_id.pop(obj_id, None)
+        if key is None:
+            return
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+
+    def after(self, key: Tuple[str, str], limit: int) -> List[
+        Tuple[str, str]
+    ]:
+        """ Up to limit keys following key, from the start when key is None
+        """
+        start = 0 if key is None else bisect_right(self.keys, tuple(key))
+        return self.keys[start:start + limit]
+
+
+class RWLock():
+    """ Readers-writer lock: any number of readers, or a single writer
+
+    Waiting writers go first, so a steady flow of readers cannot starve
+    them. The writer may take read() or write() again inside write(), but
+    a reader must not nest read(): a writer waiting in between would
+    deadlock it.
+    """
+
+    def __init__(self):
+        """ Initialize an unlocked lock
+        """
+        self._mutex = threading.Lock()
+        self._cond = threading.Condition(self._mutex)
+        self._readers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._writers_waiting = 0
+        self._readers_waiting = 0
+        self._read_guard = _Guard(self.acquire_read, self.release_read)
+        self._write_guard = _Guard(self.acquire_write, self.release_write)
+
+    def acquire_read(self):
+        """ Acquire the lock shared
+        """
+        if self._writer == threading.get_ident():
+            return
+        with self._mutex:
+            while self._writer is not None or self._writers_waiting:
+                self._readers_waiting += 1
+                self._cond.wait()
+                self._readers_waiting -= 1
+            self._readers += 1
+
+    def release_read(self):
+        """ Release a shared hold of the lock
+        """
+        if self._writer == threading.get_ident():
+            return
+        with self._mutex:
+            self._readers -= 1
+            if self._readers == 0 and self._writers_waiting:
+                self._cond.notify_all()
+
+    def read(self) -> '_Guard':
+        """ Context manager holding the lock shared
+        """
+        return self._read_guard
+
+    def acquire_write(self):
+        """ Acquire the lock exclusively
+        """
+        me = threading.get_ident()
+        if self._writer == me:
+            self._write_depth += 1
+            return
+        with self._mutex:
+            self._writers_waiting += 1
+            while self._writer is not None or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = me
+            self._write_depth = 1
+
+    def release_write(self):
+        """ Release an exclusive hold of the lock
+        """
+        self._write_depth -= 1
+        if self._write_depth:
+            return
+        with self._mutex:
+            self._writer = None
+            if self._writers_waiting or self._readers_waiting:
+                self._cond.notify_all()
+
+    def write(self) -> '_Guard':
+        """ Context manager holding the lock exclusively
+        """
+        return self._write_guard
+
+
+class _Guard():
+    """ Context manager calling acquire on entry and release on exit
+    """
+
+    def __init__(self, acquire, release):
+        """ Initialize the guard
+        """
+        self.acquire = acquire
+        self.release = release
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+LOCK = RWLock()
+PERSIST_LOCK = threading.Lock()
+
+
+class WriteBehind():
+    """ Background flusher for BASE_PERSISTENCE=write_behind
+
+    save() and remove() only mark their class dirty. A daemon thread
+    rewrites the file of each dirty class every WRITE_BEHIND_INTERVAL
+    seconds, or as soon as a class has WRITE_BEHIND_THRESHOLD pending
+    writes, so bursts of writes are coalesced into one rewrite. Pending
+    writes are flushed when the interpreter exits.
+    """
+
+    def __init__(self):
+        """ Initialize an idle flusher
+        """
+        self.dirty = {}
+        self.metrics = {
+            "writes": 0, "flushes": 0, "coalesced_writes": 0, "errors": 0,
+            "last_flush_ms": 0.0, "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def mark(self, cls: type, writes: int = 1):
+        """ Record pending writes of cls
+        """
+        with self._lock:
+            pending = self.dirty.get(cls.__name__, (cls, 0))[1] + writes
+            self.dirty[cls.__name__] = (cls, pending)
+            self.metrics["writes"] += writes
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="base-write-behind", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.flush)
+        if pending >= WRITE_BEHIND_THRESHOLD:
+            self._wakeup.set()
+
+    def flush(self, s_class: str = None):
+        """ Write every dirty class, or only s_class, to its file now
+
+        A class whose file cannot be written stays dirty and is counted
+        in metrics["errors"].
+        """
+        with self._flush_lock:
+            with self._lock:
+                if s_class is None:
+                    dirty = list(self.dirty.values())
+                    self.dirty = {}
+                elif s_class in self.dirty:
+                    dirty = [self.dirty.pop(s_class)]
+                else:
+                    dirty = []
+            for cls, pending in dirty:
+                start = time.perf_counter()
+                try:
+                    cls.save_to_file()
+                except Exception:
+                    # still dirty: retried on the next flush
+                    with self._lock:
+                        self.metrics["errors"] += 1
+                        pending += self.dirty.get(cls.__name__, (cls, 0))[1]
+                        self.dirty[cls.__name__] = (cls, pending)
+                    continue
+                elapsed = (time.perf_counter() - start) * 1000
+                with self._lock:
+                    self.metrics["flushes"] += 1
+                    self.metrics["coalesced_writes"] += pending - 1
+                    self.metrics["last_flush_ms"] = elapsed
+                    self.metrics["max_flush_ms"] = max(
+                        self.metrics["max_flush_ms"], elapsed
+                    )
+                    self.metrics["total_flush_ms"] += elapsed
+
+    def _run(self):
+        """ Flusher loop
+        """
+        while True:
+            self._wakeup.wait(WRITE_BEHIND_INTERVAL)
+            self._wakeup.clear()
+            self.flush()
+
+
+WRITE_BEHIND = WriteBehind()
+
+
+class SnapshotWriter():
+    """ Writer thread for BASE_PERSISTENCE=snapshot
+
+    save() and remove() hand over the encoded records of their class by
+    id (Base._encoded()). A daemon thread writes the latest records of
+    each class to its file, holding no lock on DATA; saves made before its
+    turn are written together. The mapping being written is copied on
+    the next write to it (copy-on-write), so it stays an immutable
+    snapshot and requests never wait for the file. Pending snapshots are
+    written when the interpreter exits.
+    """
+
+    def __init__(self):
+        """ Initialize an idle writer
+        """
+        self.pending = {}
+        self.metrics = {
+            "snapshots": 0, "writes": 0, "coalesced": 0, "errors": 0,
+            "last_write_ms": 0.0, "max_write_ms": 0.0,
+        }
+        self.writing = None
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def submit(self, cls: type, snapshot: dict):
+        """ Queue snapshot, the encoded records of cls by id, for writing,
+        under the write lock
+        """
+        with self._cond:
+            if cls.__name__ in self.pending:
+                self.metrics["coalesced"] += 1
+            self.pending[cls.__name__] = (cls, snapshot)
+            self.metrics["snapshots"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="base-snapshot-writer",
+                    daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.flush)
+            self._cond.notify_all()
+
+    def flush(self):
+        """ Wait until every queued snapshot is written
+        """
+        with self._cond:
+            while self.pending or self.writing is not None:
+                self._cond.wait()
+
+    def _run(self):
+        """ Writer loop
+        """
+        while True:
+            with self._cond:
+                while not self.pending:
+                    self._cond.wait()
+            # picked up under the read lock: no save() is writing to it
+            with LOCK.read():
+                with self._cond:
+                    s_class = next(iter(self.pending))
+                    cls, snapshot = self.pending.pop(s_class)
+                    self.writing = snapshot
+            start = time.perf_counter()
+            try:
+                cls._write_snapshot(snapshot)
+            except Exception:
+                with self._cond:
+                    self.metrics["errors"] += 1
+            elapsed = (time.perf_counter() - start) * 1000
+            with self._cond:
+                self.writing = None
+                self.metrics["writes"] += 1
+                self.metrics["last_write_ms"] = elapsed
+                self.metrics["max_write_ms"] = max(
+                    self.metrics["max_write_ms"], elapsed
+                )
+                self._cond.notify_all()
+
+
+SNAPSHOT_WRITER = SnapshotWriter()
 
 
 class Base():
     """ Base class
+
+    Subclasses declare in INDEXED_ATTRIBUTES the attributes to keep
+    secondary hash indexes on. The indexes follow save(), remove() and
+    load_from_file(), and search() uses them for matching attributes.
+
+    Objects live in DATA, mirrored to .db_<Class>.json files, unless
+    BASE_STORAGE=sqlite selects the shared SQLite database of
+    models.sqlite_storage, where indexed attributes become indexed
+    columns.
+
+    Attributes live in __slots__ rather than a per-object __dict__:
+    subclasses list their own attributes in __slots__ to stay compact, or
+    leave it out to get a regular __dict__.
+
+    to_json_str() of the public attributes, as listed by the API, is cached
+    on the object until an attribute is assigned; json_version then moves
+    on, so encoded fragments can be cached by (id, json_version). Values
+    mutated in place are not seen: assign them instead. Nothing else is
+    cached, so persisting a store does not grow its objects.
     """
 
+    __slots__ = ('id', 'created_at', 'updated_at',
+                 '_json_cache', '_json_version')
+    INDEXED_ATTRIBUTES = ()
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
+        object.__setattr__(self, '_json_cache', None)
+        object.__setattr__(self, '_json_version', 0)
         s_class = str(self.__class__.__name__)
         if DATA.get(s_class) is None:
             DATA[s_class] = {}
 
         self.id = kwargs.get('id', str(uuid.uuid4()))
-        if kwargs.get('created_at') is not None:
-            self.created_at = datetime.strptime(kwargs.get('created_at'),
-                                                TIMESTAMP_FORMAT)
+        created_at = kwargs.get('created_at')
+        updated_at = kwargs.get('updated_at')
+        now = datetime.utcnow()
+        if created_at is not None:
+            self.created_at = parse_timestamp(created_at)
         else:
-            self.created_at = datetime.utcnow()
-        if kwargs.get('updated_at') is not None:
-            self.updated_at = datetime.strptime(kwargs.get('updated_at'),
-                                                TIMESTAMP_FORMAT)
+            self.created_at = now
+        # datetimes are immutable, equal timestamps can share one object
+        if updated_at is not None and updated_at != created_at:
+            self.updated_at = parse_timestamp(updated_at)
+        elif updated_at is None and created_at is not None:
+            self.updated_at = now
         else:
-            self.updated_at = datetime.utcnow()
+            self.updated_at = self.created_at
 
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
@@ -44,11 +659,44 @@ class Base():
             return False
         return (self.id == other.id)
 
+    def __setattr__(self, name: str, value):
+        """ Set an attribute, dropping the cached serializations
+        """
+        object.__setattr__(self, name, value)
+        if getattr(self, '_json_cache', None) is not None \
+                and name not in CACHE_ATTRIBUTES:
+            object.__setattr__(self, '_json_cache', None)
+            object.__setattr__(self, '_json_version', self._json_version + 1)
+
+    @property
+    def json_version(self) -> int:
+        """ Counter moving on whenever cached serializations are dropped
+        """
+        return getattr(self, '_json_version', 0)
+
     def to_json(self, for_serialization: bool = False) -> dict:
         """ Convert the object a JSON dictionary
         """
+        return self._build_json(for_serialization)
+
+    def to_json_str(self, for_serialization: bool = False) -> str:
+        """ The object encoded as a JSON string, cached on the object for
+        the public attributes only
+        """
+        if for_serialization:
+            return json.dumps(self._build_json(True))
+        encoded = getattr(self, '_json_cache', None)
+        if encoded is None:
+            encoded = json.dumps(self._build_json(False))
+            object.__setattr__(self, '_json_cache', encoded)
+        return encoded
+
+    def _build_json(self, for_serialization: bool) -> dict:
+        """ JSON dictionary of the object, computed
+        """
         result = {}
-        for key, value in self.__dict__.items():
+        for key in self._attribute_names():
+            value = getattr(self, key, None)
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
@@ -57,54 +705,412 @@ class Base():
                 result[key] = value
         return result
 
+    def _attribute_names(self) -> List[str]:
+        """ Names of the attributes of the object, slots first in
+        definition order, then anything in its __dict__
+        """
+        cls = type(self)
+        names = cls.__dict__.get('_slot_names')
+        if names is None:
+            names = []
+            for klass in reversed(cls.__mro__):
+                slots = klass.__dict__.get('__slots__', ())
+                if isinstance(slots, str):
+                    slots = (slots,)
+                names.extend(name for name in slots
+                             if name not in ('__dict__', '__weakref__')
+                             and name not in CACHE_ATTRIBUTES)
+            cls._slot_names = names
+        names = [name for name in names if hasattr(self, name)]
+        if hasattr(self, '__dict__'):
+            names.extend(self.__dict__)
+        return names
+
     @classmethod
     def load_from_file(cls):
-        """ Load all objects from file
+        """ Load all objects from file, then replay the journal written
+        since the file was last rewritten
+
+        The file is parsed one record at a time by iter_store(). With
+        BASE_LAZY_LOAD=1 the records stay raw JSON dictionaries in a
+        LazyRecords mapping and are turned into objects on first access:
+        the file is then parsed by a single json.load(), 1.7x as fast,
+        whose keys are already shared by all records.
+
+        With BASE_STORAGE=sqlite, the JSON store is imported into an empty
+        table instead, once, in a single transaction
+        (SQLiteStorage.import_if_empty()).
         """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
+        if STORAGE == "sqlite":
+            sqlite_storage.STORE.import_if_empty(cls, (
+                cls(**obj_json) for obj_json in cls._iter_stored_records()
+            ))
             return
+        with LOCK.write():
+            DATA[s_class] = LazyRecords(cls) if LAZY_LOAD else {}
+            INDEXES.pop(s_class, None)
+            ORDERS.pop(s_class, None)
+            ENCODED.pop(s_class, None)
+            if LAZY_LOAD and path.exists(file_path) \
+                    and path.getsize(file_path):
+                with open(file_path, 'r') as f:
+                    dict.update(DATA[s_class], json.load(f))
+            elif path.exists(file_path):
+                for obj_id, obj_json in iter_store(file_path):
+                    DATA[s_class][obj_id] = cls._from_record(obj_json)
+            cls._replay_journal()
+            cls._reindex()
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    def _from_record(cls, obj_json: dict):
+        """ Object for a stored JSON record, or the record itself when
+        loading lazily (with interned keys, shared by all records)
+        """
+        if type(DATA[cls.__name__]) is LazyRecords:
+            return {sys.intern(k): v for k, v in obj_json.items()}
+        return cls(**obj_json)
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
+
+        The objects are snapshotted under the read lock and serialized
+        without it, so neither readers nor writers wait for the whole
+        rewrite. The file is replaced atomically, and the part of the
+        journal it supersedes is deleted.
+        """
+        if STORAGE == "sqlite":
+            return
+        s_class = cls.__name__
+        file_path = ".db_{}.json".format(s_class)
+        journal_path = ".db_{}.journal".format(s_class)
+        with PERSIST_LOCK:
+            with LOCK.read():
+                snapshot = list(dict.items(DATA[s_class]))
+                offset = path.getsize(journal_path) \
+                    if path.exists(journal_path) else 0
+            write_store(file_path, (
+                (obj_id, _encode(obj)) for obj_id, obj in snapshot
+            ))
+            with LOCK.read():
+                cls._trim_journal(offset)
+
+    @classmethod
+    def _write_snapshot(cls, snapshot: dict):
+        """ Write a snapshot of encoded records by id to the file, which
+        then holds every change: the journal is deleted
+        """
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        with PERSIST_LOCK:
+            write_store(".db_{}.json".format(s_class), snapshot.items())
+            with LOCK.read():
+                if path.exists(journal_path):
+                    os.remove(journal_path)
+                JOURNAL_SIZES[s_class] = 0
+
+    @classmethod
+    def _trim_journal(cls, offset: int):
+        """ Drop the first offset bytes of the journal, which the file
+        already holds, keeping what was appended since
+        """
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        JOURNAL_SIZES[s_class] = 0
+        if not path.exists(journal_path):
+            return
+        with open(journal_path, 'rb') as f:
+            f.seek(offset)
+            tail = f.read()
+        if not tail:
+            os.remove(journal_path)
+            return
+        with open(journal_path + ".tmp", 'wb') as f:
+            f.write(tail)
+        os.replace(journal_path + ".tmp", journal_path)
+        JOURNAL_SIZES[s_class] = tail.count(b"\n")
+
+    @classmethod
+    def iter_records(cls, for_serialization: bool = True) -> Iterator[dict]:
+        """ JSON records of all objects of the class, one at a time
+
+        Once the class is loaded, records come from the stored objects.
+        Otherwise they are streamed from .db_<Class>.json by iter_store(),
+        with the journal applied on the fly, without building objects:
+        memory stays bounded by the size of the journal. With
+        BASE_STORAGE=sqlite they are fetched from the database in batches.
+        """
+        s_class = cls.__name__
+
+        def record(obj):
+            if type(obj) is not dict:
+                return obj.to_json(for_serialization)
+            if for_serialization:
+                return obj
+            return {k: v for k, v in obj.items() if k[0] != '_'}
+
+        if STORAGE == "sqlite":
+            records = sqlite_storage.STORE.iter_records(cls)
+        elif s_class in DATA:
+            with LOCK.read():
+                records = list(dict.values(DATA[s_class]))
+        else:
+            records = cls._iter_stored_records()
+        for obj in records:
+            yield record(obj)
+
+    @classmethod
+    def _iter_stored_records(cls) -> Iterator[dict]:
+        """ Records of .db_<Class>.json with its journal applied, streamed
         """
         s_class = cls.__name__
+        journal = {}
+        journal_path = ".db_{}.journal".format(s_class)
+        if path.exists(journal_path):
+            with open(journal_path, 'r') as f:
+                for line in f:
+                    try:
+                        op, value = json.loads(line)
+                    except ValueError:
+                        break
+                    if op == "save":
+                        journal.pop(value['id'], None)
+                        journal[value['id']] = value
+                    else:
+                        journal[value] = None
         file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        if path.exists(file_path):
+            for obj_id, obj_json in iter_store(file_path):
+                if obj_id not in journal:
+                    yield obj_json
+        for obj_json in journal.values():
+            if obj_json is not None:
+                yield obj_json
+
+    @classmethod
+    def _replay_journal(cls):
+        """ Apply the journaled saves and removals on top of DATA
+        """
+        s_class = cls.__name__
+        journal_path = ".db_{}.journal".format(s_class)
+        JOURNAL_SIZES[s_class] = 0
+        if not path.exists(journal_path):
+            return
+        with open(journal_path, 'r') as f:
+            for line in f:
+                try:
+                    op, value = json.loads(line)
+                except ValueError:
+                    # torn last line of an interrupted append
+                    break
+                if op == "save":
+                    DATA[s_class][value['id']] = cls._from_record(value)
+                else:
+                    DATA[s_class].pop(value, None)
+                JOURNAL_SIZES[s_class] += 1
+
+    @classmethod
+    def _persist(cls, op: str, obj: TypeVar('Base')) -> bool:
+        """ Persist a save or remove of obj
+        """
+        return cls._persist_many(op, [obj])
+
+    @classmethod
+    def _persist_many(cls, op: str, objs: List[TypeVar('Base')]) -> bool:
+        """ Persist the saves or removals of objs in one go, under the
+        write lock
+
+        With BASE_PERSISTENCE=journal, the change is appended to
+        .db_<Class>.journal, and the file is rewritten (compacting the
+        journal) once the journal holds more than
+        max(BASE_JOURNAL_THRESHOLD, number of objects) records. With
+        BASE_PERSISTENCE=write_behind, the class is marked dirty for the
+        WRITE_BEHIND flusher. With BASE_PERSISTENCE=snapshot, a copy of
+        the encoded records is queued for the SNAPSHOT_WRITER thread.
+        Otherwise the whole file is rewritten.
+
+        Returns True when the file must be rewritten: the caller does it
+        with save_to_file() once it released the write lock.
+        """
+        if PERSISTENCE == "write_behind":
+            WRITE_BEHIND.mark(cls, len(objs))
+            return False
+        if PERSISTENCE == "snapshot":
+            SNAPSHOT_WRITER.submit(cls, cls._encoded())
+            return False
+        if PERSISTENCE != "journal":
+            return True
+        s_class = cls.__name__
+        lines = "".join(
+            '["save", ' + obj.to_json_str(True) + ']\n' if op == "save"
+            else json.dumps([op, obj.id]) + "\n" for obj in objs
+        )
+        with open(".db_{}.journal".format(s_class), 'a') as f:
+            f.write(lines)
+        JOURNAL_SIZES[s_class] = JOURNAL_SIZES.get(s_class, 0) + len(objs)
+        return JOURNAL_SIZES[s_class] > max(JOURNAL_THRESHOLD,
+                                            len(DATA[s_class]))
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def flush(cls):
+        """ Write the pending write-behind changes of the class, or of
+        every class when called on Base, and wait for queued snapshots
+        """
+        WRITE_BEHIND.flush(None if cls is Base else cls.__name__)
+        SNAPSHOT_WRITER.flush()
 
     def save(self):
         """ Save current object
         """
         s_class = self.__class__.__name__
-        self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        if STORAGE == "sqlite":
+            self.updated_at = datetime.utcnow()
+            sqlite_storage.STORE.save(self.__class__, [self])
+            return
+        with LOCK.write():
+            self.updated_at = datetime.utcnow()
+            DATA[s_class][self.id] = self
+            for index in self.__class__._indexes().values():
+                index.add(self.id, getattr(self, index.attribute, None))
+            self.__class__._order().add(self.id, self.created_at)
+            encoded = self.__class__._writable_encoded()
+            if encoded is not None:
+                encoded[self.id] = self.to_json_str(True)
+            rewrite = self.__class__._persist("save", self)
+        if rewrite:
+            self.__class__.save_to_file()
+
+    @classmethod
+    def save_many(cls, objs: List[TypeVar('Base')]):
+        """ Store objs as they are, keeping their timestamps, with a
+        single persistence step for all of them (used by bulk imports)
+        """
+        if not objs:
+            return
+        if STORAGE == "sqlite":
+            sqlite_storage.STORE.save(cls, objs)
+            return
+        s_class = cls.__name__
+        with LOCK.write():
+            indexes = cls._indexes().values()
+            order = cls._order()
+            encoded = cls._writable_encoded()
+            for obj in objs:
+                DATA[s_class][obj.id] = obj
+                for index in indexes:
+                    index.add(obj.id, getattr(obj, index.attribute, None))
+                order.add(obj.id, obj.created_at)
+                if encoded is not None:
+                    encoded[obj.id] = obj.to_json_str(True)
+            rewrite = cls._persist_many("save", objs)
+        if rewrite:
+            cls.save_to_file()
 
     def remove(self):
         """ Remove object
         """
         s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
+        if STORAGE == "sqlite":
+            sqlite_storage.STORE.remove(self.__class__, self.id)
+            return
+        with LOCK.write():
+            if dict.get(DATA[s_class], self.id) is None:
+                return
             del DATA[s_class][self.id]
+            for index in self.__class__._indexes().values():
+                index.discard(self.id)
+            self.__class__._order().discard(self.id)
+            encoded = self.__class__._writable_encoded()
+            if encoded is not None:
+                encoded.pop(self.id, None)
+            rewrite = self.__class__._persist("remove", self)
+        if rewrite:
             self.__class__.save_to_file()
 
+    @classmethod
+    def _indexes(cls) -> dict:
+        """ Secondary indexes of the class, by attribute name, built from
+        the stored objects on first use
+        """
+        s_class = cls.__name__
+        if INDEXES.get(s_class) is None:
+            # built aside, concurrent readers never see it half done
+            indexes = {}
+            for attribute in cls.INDEXED_ATTRIBUTES:
+                index = Index(attribute)
+                for obj_id, obj in dict.items(DATA.get(s_class, {})):
+                    index.add(obj_id, _attribute(obj, attribute))
+                indexes[attribute] = index
+            INDEXES[s_class] = indexes
+        return INDEXES[s_class]
+
+    @classmethod
+    def _order(cls) -> OrderedIndex:
+        """ Ordered index of the class, built from the stored objects on
+        first use
+        """
+        s_class = cls.__name__
+        if ORDERS.get(s_class) is None:
+            order = OrderedIndex()
+            order.keys = sorted(
+                OrderedIndex.key(obj_id, _attribute(obj, 'created_at'))
+                for obj_id, obj in dict.items(DATA.get(s_class, {}))
+            )
+            order.by_id = {key[1]: key for key in order.keys}
+            ORDERS[s_class] = order
+        return ORDERS[s_class]
+
+    @classmethod
+    def _encoded(cls) -> dict:
+        """ Encoded records of the class by id, for snapshots, kept up to
+        date by save() and remove()
+
+        With BASE_PERSISTENCE=snapshot they are built by _reindex(), i.e.
+        when the class is loaded, so no request encodes the whole store
+        under the write lock. They are built here only if the mode was
+        switched after loading.
+        """
+        s_class = cls.__name__
+        if ENCODED.get(s_class) is None:
+            ENCODED[s_class] = {
+                obj_id: _encode(obj)
+                for obj_id, obj in dict.items(DATA.get(s_class, {}))
+            }
+        return ENCODED[s_class]
+
+    @classmethod
+    def _writable_encoded(cls) -> dict:
+        """ Encoded records of the class, None until built, copied first
+        if the SNAPSHOT_WRITER is writing them; under the write lock
+        """
+        s_class = cls.__name__
+        encoded = ENCODED.get(s_class)
+        if encoded is not None and encoded is SNAPSHOT_WRITER.writing:
+            encoded = ENCODED[s_class] = dict(encoded)
+        return encoded
+
+    @classmethod
+    def _reindex(cls):
+        """ Rebuild the secondary and ordered indexes from all stored
+        objects, and the encoded records with BASE_PERSISTENCE=snapshot
+        """
+        with LOCK.write():
+            INDEXES.pop(cls.__name__, None)
+            ORDERS.pop(cls.__name__, None)
+            ENCODED.pop(cls.__name__, None)
+            cls._indexes()
+            cls._order()
+            if PERSISTENCE == "snapshot":
+                cls._encoded()
+
     @classmethod
     def count(cls) -> int:
         """ Count all objects
         """
+        if STORAGE == "sqlite":
+            return sqlite_storage.STORE.count(cls)
         s_class = cls.__name__
         return len(DATA[s_class].keys())
 
@@ -118,9 +1124,37 @@ class Base():
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
+        if STORAGE == "sqlite":
+            return sqlite_storage.STORE.get(cls, id)
         s_class = cls.__name__
+        # a single dictionary lookup is atomic, no lock needed
         return DATA[s_class].get(id)
 
+    @classmethod
+    def page(cls, limit: int, after: Tuple[str, str] = None) -> Tuple[
+        List[TypeVar('Base')], Tuple[str, str]
+    ]:
+        """ Keyset pagination over the objects ordered by (created_at, id)
+
+        Args:
+            limit: maximum number of objects returned
+            after: key of the last object of the previous page, None for
+              the first page
+        Returns:
+            The objects of the page, and the key to pass as after for the
+            next page (None on the last page)
+        """
+        if STORAGE == "sqlite":
+            return sqlite_storage.STORE.page(cls, limit, after)
+        s_class = cls.__name__
+        with LOCK.read():
+            keys = cls._order().after(after, limit + 1)
+            objs = DATA[s_class]
+            page = [objs[obj_id] for _, obj_id in keys[:limit]
+                    if obj_id in objs]
+        next_key = keys[limit - 1] if len(keys) > limit else None
+        return page, next_key
+
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
@@ -135,4 +1169,22 @@ class Base():
                     return False
             return True
 
-        return list(filter(_search, DATA[s_class].values()))
+        if STORAGE == "sqlite":
+            return list(filter(_search, sqlite_storage.STORE.search(
+                cls, attributes)))
+        with LOCK.read():
+            candidates = None
+            indexes = cls._indexes()
+            for k, v in attributes.items():
+                if k not in indexes:
+                    continue
+                matches = indexes[k].lookup(v)
+                if matches is not None and (
+                        candidates is None or len(matches) < len(candidates)):
+                    candidates = matches
+            if candidates is None:
+                return list(filter(_search, DATA[s_class].values()))
+            objs = DATA[s_class]
+            return list(filter(_search, [
+                objs[obj_id] for obj_id in candidates if obj_id in objs
+            ]))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+""" NDJSON bulk export and import of Base stores
+"""
+import importlib
+import json
+import os
+import pkgutil
+from typing import Dict, Iterable, Iterator
+import models
+from models.base import DATA, Base
+
+
+BATCH_SIZE = int(os.getenv("BASE_BULK_BATCH_SIZE", "1000"))
+
+
+def model_classes() -> Dict[str, type]:
+    """ Base subclasses of the models package, by class name
+    """
+    for module in pkgutil.iter_modules(models.__path__):
+        importlib.import_module("models." + module.name)
+    classes = {}
+    pending = [Base]
+    while pending:
+        for cls in pending.pop().__subclasses__():
+            classes[cls.__name__] = cls
+            pending.append(cls)
+    return classes
+
+
+def export_ndjson(cls: type, for_serialization: bool = True,
+                  batch_size: int = BATCH_SIZE) -> Iterator[str]:
+    """ NDJSON of all objects of cls, yielded batch_size lines at a time
+
+    Records come from cls.iter_records(), so memory does not grow with
+    the size of the store.
+
+    Args:
+        cls: a Base subclass
+        for_serialization: include the private (underscore) attributes
+        batch_size: lines per yielded chunk
+    """
+    lines = []
+    for record in cls.iter_records(for_serialization):
+        lines.append(json.dumps(record))
+        if len(lines) >= batch_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def import_ndjson(cls: type, lines: Iterable[str],
+                  batch_size: int = BATCH_SIZE) -> int:
+    """ Stores the objects of NDJSON lines, as exported by export_ndjson()
+
+    Objects are stored batch_size at a time with cls.save_many(), so the
+    store is persisted once per batch rather than once per object.
+
+    Args:
+        cls: a Base subclass
+        lines: NDJSON lines, one record each; blank lines are skipped
+        batch_size: objects per persistence step
+    Returns:
+        Number of objects imported
+    """
+    if cls.__name__ not in DATA:
+        cls.load_from_file()
+    count = 0
+    batch = []
+    for line in lines:
+        if not line.strip():
+            continue
+        batch.append(cls(**json.loads(line)))
+        if len(batch) >= batch_size:
+            cls.save_many(batch)
+            count += len(batch)
+            batch = []
+    cls.save_many(batch)
+    return count + len(batch)
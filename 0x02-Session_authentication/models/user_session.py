@@ -7,6 +7,9 @@ from models.base import Base
 class UserSession(Base):
     """ UserSession class
     """
+    __slots__ = ('user_id', 'session_id')
+    INDEXED_ATTRIBUTES = ("session_id", "user_id")
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize UserSession
         """
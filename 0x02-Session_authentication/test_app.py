@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+""" Unit tests of the authentication of api.v1.app
+"""
+import base64
+import os
+import tempfile
+import unittest
+from unittest import mock
+from api.v1 import app as api
+from api.v1.auth.basic_auth import BasicAuth
+from api.v1.auth.session_auth import SessionAuth
+from api.v1.auth.session_db_auth import SessionDBAuth
+from api.v1.auth.session_exp_auth import SessionExpAuth
+from models.base import DATA
+from models.user import User
+
+
+class TestCurrentUserOnce(unittest.TestCase):
+    """ current_user() runs exactly once per request, whatever the
+    backend
+    """
+
+    def setUp(self):
+        """ Stores one user in a temporary working directory
+        """
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        self.saved = dict(DATA)
+        DATA.clear()
+        self.user = User(email="bob@example.com")
+        self.user.password = "pwd"
+        self.user.save()
+        self.session_name = os.environ.setdefault("SESSION_NAME",
+                                                  "_my_session_id")
+        self.client = api.app.test_client(use_cookies=False)
+
+    def tearDown(self):
+        """ Restores the backend, the stored objects and the directory
+        """
+        api.auth = None
+        DATA.clear()
+        DATA.update(self.saved)
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def calls(self, auth, headers, status=200) -> int:
+        """ current_user() calls made by auth over GET /api/v1/users/me
+        """
+        api.auth = auth
+        with mock.patch.object(auth, "current_user",
+                               wraps=auth.current_user) as current_user:
+            response = self.client.get("/api/v1/users/me", headers=headers)
+        self.assertEqual(response.status_code, status)
+        return current_user.call_count
+
+    def basic(self, password: str) -> dict:
+        """ Authorization header of bob with password
+        """
+        credentials = "bob@example.com:{}".format(password).encode()
+        return {"Authorization": "Basic " +
+                base64.b64encode(credentials).decode()}
+
+    def test_basic_auth(self):
+        """ BasicAuth, on a miss and a hit of its credential cache
+        """
+        auth = BasicAuth()
+        self.assertEqual(self.calls(auth, self.basic("pwd")), 1)
+        self.assertEqual(self.calls(auth, self.basic("pwd")), 1)
+
+    def test_basic_auth_rejected(self):
+        """ A rejected user is not authenticated twice either
+        """
+        self.assertEqual(self.calls(BasicAuth(), self.basic("nope"), 403),
+                         1)
+
+    def test_session_backends(self):
+        """ SessionAuth, SessionExpAuth and SessionDBAuth
+        """
+        for auth_class in (SessionAuth, SessionExpAuth, SessionDBAuth):
+            with self.subTest(auth_class.__name__):
+                auth = auth_class()
+                headers = {"Cookie": "{}={}".format(
+                    self.session_name, auth.create_session(self.user.id))}
+                self.assertEqual(self.calls(auth, headers), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+""" Unit tests of the storage of models.base
+"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+import benchmark
+import models.base
+from models.base import DATA
+from models.user import User
+
+
+class StoreTestCase(unittest.TestCase):
+    """ Runs each test in a temporary directory on a fresh store
+    """
+
+    def setUp(self):
+        """ Works in a temporary directory on a fresh User store
+        """
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)
+        self.saved = dict(DATA)
+        DATA.clear()
+
+    def tearDown(self):
+        """ Restores the stored objects and the directory
+        """
+        DATA.clear()
+        DATA.update(self.saved)
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+
+class TestStress(StoreTestCase):
+    """ Short runs of benchmark.stress(): no worker error, and no count,
+    index or file drift once they are done
+    """
+
+    def stress(self, persistence: str):
+        """ Runs stress() on 200 users and 4 threads with persistence
+        """
+        users = benchmark.populate(200)
+        User.save_to_file()
+        with mock.patch.object(models.base, "PERSISTENCE", persistence), \
+                mock.patch.object(models.base, "WRITE_BEHIND_INTERVAL", 0.05):
+            result = benchmark.stress(users, 4, 0.5)
+        self.assertEqual(result["errors"], [])
+        self.assertGreater(result["ops_per_sec"], 0)
+
+    def test_file(self):
+        """ Each save rewrites the file
+        """
+        self.stress("file")
+
+    def test_write_behind(self):
+        """ Saves are flushed by the write-behind thread
+        """
+        self.stress("write_behind")
+
+
+class TestLoad(StoreTestCase):
+    """ load_from_file(), eager and lazy
+    """
+
+    def load(self, lazy: bool) -> dict:
+        """ Public JSON of the users loaded with BASE_LAZY_LOAD=lazy
+        """
+        with mock.patch.object(models.base, "LAZY_LOAD", lazy):
+            User.load_from_file()
+        return {user.id: user.to_json() for user in User.all()}
+
+    def test_lazy_matches_eager(self):
+        """ Both loads give the same users, journal included
+        """
+        users = benchmark.populate(50)
+        User.save_to_file()
+        with mock.patch.object(models.base, "PERSISTENCE", "journal"):
+            users[0].first_name = "Journaled"
+            users[0].save()
+        eager = self.load(False)
+        self.assertEqual(len(eager), 50)
+        self.assertEqual(eager[users[0].id]["first_name"], "Journaled")
+        self.assertEqual(self.load(True), eager)
+
+    def test_empty_file(self):
+        """ An empty store file loads as no users
+        """
+        open(".db_User.json", "w").close()
+        for lazy in (False, True):
+            self.assertEqual(self.load(lazy), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,10 +5,12 @@
 from flask import Flask, jsonify, request, abort, make_response, redirect
 from flask import url_for
 from auth import Auth
+import bcrypt_cost
 
 
 app = Flask(__name__)
 AUTH = Auth()
+bcrypt_cost.ensure_calibrated()
 
 
 @app.route('/', methods=['GET'], strict_slashes=False)
@@ -106,5 +108,12 @@ def update_password():
         abort(403)
 
 
+@app.route('/metrics/bcrypt', methods=['GET'], strict_slashes=False)
+def bcrypt_metrics():
+    """ bcrypt cost calibration /GET route
+    """
+    return jsonify(bcrypt_cost.metrics()), 200
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=int("5000"))
@@ -2,6 +2,7 @@
 """ User Auth Module
 """
 import bcrypt
+from bcrypt_cost import get_cost, needs_rehash, record_rehash
 from db import DB
 from user import User
 from sqlalchemy.orm.exc import NoResultFound
@@ -10,9 +11,11 @@ from uuid import uuid4
 
 
 def _hash_password(password: str) -> bytes:
-    """ Hashes user password
+    """ Hashes user password with the calibrated bcrypt cost
     """
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
+    return bcrypt.hashpw(
+        password.encode("utf-8"), bcrypt.gensalt(get_cost())
+    )
 
 
 def _generate_uuid() -> str:
@@ -47,11 +50,19 @@ class Auth:
 
     def valid_login(self, email: str, password: str) -> bool:
         """ Checks if user login is a valid login
+
+        A valid password whose stored hash was made with a lower cost than
+        the calibrated one is rehashed on the way.
         """
         try:
             user = self._db.find_user_by(email=email)
             encoded_pwd = password.encode("utf-8")
             if user and bcrypt.checkpw(encoded_pwd, user.hashed_password):
+                if needs_rehash(user.hashed_password):
+                    self._db.update_user(
+                        user.id, hashed_password=_hash_password(password)
+                    )
+                    record_rehash()
                 return True
             return False
         except NoResultFound: